@@ -0,0 +1,131 @@
+import numpy as np
+
+#############################
+# CODIFICACIÓN DE SEÑALES
+#############################
+
+# Valores de señal usados por el motor (int8)
+BUY = 1
+SELL = -1
+NO_SIGNAL = 0
+
+# Modos de simulación disponibles
+MODE_NEXT_CANDLE = "next_candle"  # Cada señal abre y cierra en la vela siguiente
+MODE_POSITION = "position"        # Se mantiene la posición desde 'buy' hasta el siguiente 'sell'
+
+def encode_signals(signals):
+    """
+    Convierte una secuencia de señales a un array int8 (+1 compra, -1 venta, 0 sin señal).
+    Acepta arrays numéricos o las etiquetas de texto 'buy'/'sell'/''.
+    """
+    arr = np.asarray(signals)
+    if arr.dtype.kind in "biuf":
+        return np.sign(np.nan_to_num(arr)).astype(np.int8)
+    arr = arr.astype(str)
+    encoded = np.zeros(len(arr), dtype=np.int8)
+    encoded[arr == "buy"] = BUY
+    encoded[arr == "sell"] = SELL
+    return encoded
+
+#############################
+# MOTOR DE BACKTEST VECTORIZADO
+#############################
+
+def _forward_fill(values, mask):
+    """Propaga hacia adelante values[i] desde la última posición donde mask es True (0 antes de la primera)."""
+    idx = np.where(mask, np.arange(len(values)), -1)
+    np.maximum.accumulate(idx, out=idx)
+    return np.where(idx >= 0, values[np.maximum(idx, 0)], 0)
+
+def _next_candle_pnl(close, signals, trade_value):
+    """
+    PnL por vela del modo 'vela siguiente': cada señal en la vela i se liquida en i+1.
+    Reproduce exactamente el cálculo histórico de calculate_profit (la primera vela se ignora).
+    """
+    n = len(close)
+    bar_pnl = np.zeros(n)
+    if n < 3:
+        return bar_pnl, np.empty(0)
+    active = signals[1:-1] != NO_SIGNAL
+    entry = close[1:-1]
+    exit_ = close[2:]
+    pnl = np.where(active, (exit_ - entry) * (trade_value / entry), 0.0)
+    bar_pnl[2:] = pnl
+    return bar_pnl, pnl[active]
+
+def _position_pnl(close, signals, trade_value):
+    """
+    PnL por vela del modo 'posición': se compra al cierre de la vela 'buy' y se mantiene
+    hasta el cierre de la siguiente vela 'sell' (o la última vela si no hay venta).
+    """
+    n = len(close)
+    bar_pnl = np.zeros(n)
+    if n < 2:
+        return bar_pnl, np.empty(0)
+    # Estado tras cada vela: 1 comprado, -1/0 fuera de mercado
+    state = _forward_fill(signals, signals != NO_SIGNAL)
+    long = state == BUY
+    entries = long & ~np.concatenate(([False], long[:-1]))
+    # Una compra en la última vela no llega a mantenerse ninguna vela: no es una operación
+    entries[-1] = False
+    # Unidades compradas en cada entrada, propagadas mientras dura la posición
+    units = _forward_fill(np.where(entries, trade_value / close, 0.0), entries)
+    held = np.concatenate(([False], long[:-1]))
+    held_units = np.concatenate(([0.0], units[:-1]))
+    bar_pnl[1:] = np.where(held[1:], held_units[1:] * np.diff(close), 0.0)
+    # PnL por operación: suma de las velas de cada tramo comprado
+    trade_id = np.cumsum(entries)
+    trade_pnl = np.bincount(trade_id[held], weights=bar_pnl[held], minlength=trade_id[-1] + 1)[1:]
+    return bar_pnl, trade_pnl
+
+def max_drawdown(equity):
+    """Máxima caída relativa desde un pico de la curva de capital (0.25 = -25%)."""
+    if len(equity) == 0:
+        return 0.0
+    peaks = np.maximum.accumulate(equity)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdowns = np.where(peaks > 0, (peaks - equity) / peaks, 0.0)
+    return float(drawdowns.max())
+
+def run_backtest(close, signals, initial_capital, percent_per_trade, mode=MODE_NEXT_CANDLE):
+    """
+    Ejecuta el backtest sobre arrays completos en una sola pasada vectorizada.
+    'close' son los precios de cierre y 'signals' las señales (codificadas o en texto).
+    Cada operación invierte 'percent_per_trade' % del capital inicial.
+    Devuelve un diccionario con el PnL por operación, la curva de capital y las estadísticas.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    signals = encode_signals(signals)
+    if len(close) != len(signals):
+        raise ValueError("'close' y 'signals' deben tener la misma longitud.")
+    trade_value = initial_capital * percent_per_trade / 100
+
+    if mode == MODE_NEXT_CANDLE:
+        bar_pnl, trade_pnl = _next_candle_pnl(close, signals, trade_value)
+    elif mode == MODE_POSITION:
+        bar_pnl, trade_pnl = _position_pnl(close, signals, trade_value)
+    else:
+        raise ValueError(f"Modo de backtest desconocido: {mode}")
+
+    equity = initial_capital + np.cumsum(bar_pnl)
+    profit = float(bar_pnl.sum())
+    trades = len(trade_pnl)
+    return {
+        "trade_pnl": trade_pnl,
+        "equity": equity,
+        "stats": {
+            "profit": profit,
+            "total_return": profit / initial_capital if initial_capital else 0.0,
+            "max_drawdown": max_drawdown(equity),
+            "trades": trades,
+            "win_rate": float((trade_pnl > 0).sum() / trades) if trades else 0.0,
+        },
+    }
+
+def buy_and_hold_backtest(close, initial_capital):
+    """Backtest Buy & Hold: compra todo el capital en la primera vela y vende en la última."""
+    close = np.asarray(close, dtype=np.float64)
+    signals = np.zeros(len(close), dtype=np.int8)
+    if len(close):
+        signals[0] = BUY
+    return run_backtest(close, signals, initial_capital, 100, mode=MODE_POSITION)
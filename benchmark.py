@@ -0,0 +1,355 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import threading
+import importlib.util
+import logging
+import urllib.parse
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import pandas as pd
+from intervalos import INTERVAL_MS
+
+#############################
+# BENCHMARKS REPRODUCIBLES DE LAS RUTAS CRÍTICAS
+#############################
+#
+# Etapas medidas (cada una por separado y la suma total):
+#   - fetch_api: descarga paginada contra una API de velas local (simulada)
+#   - ingest:    save_to_db por páginas (PostgreSQL real con --db o un sustituto en memoria)
+#   - query:     lectura del rango (fetch_data_from_db con --db o la caché local en frío y en caliente)
+#   - strategy:  estrategia EMA sobre la serie completa
+#   - backtest:  motor vectorizado en los dos modos
+#   - render:    submuestreo y dibujo con mplfinance (backend Agg)
+# Los resultados se guardan en JSON y se comparan con una referencia guardada.
+
+START_MS = 1_500_000_000_000 // 60_000 * 60_000  # Inicio fijo de las velas sintéticas
+BENCH_SYMBOL = "BENCHUSDT"
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+STAGES = ["fetch_api", "ingest", "query", "strategy", "backtest", "render"]
+
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+#############################
+# GENERADOR DETERMINISTA DE VELAS
+#############################
+
+def synthetic_candles(n, interval="1m", seed=42):
+    """Velas sintéticas reproducibles (paseo aleatorio geométrico) como dict de arrays."""
+    rng = np.random.default_rng(seed)
+    step = INTERVAL_MS[interval]
+    close = 10_000 * np.exp(np.cumsum(rng.normal(0, 0.001, n)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.0005, n)) * close
+    volume = rng.gamma(2.0, 5.0, n)
+    taker_base = volume * rng.uniform(0.3, 0.7, n)
+    return {
+        "timestamp": START_MS + np.arange(n, dtype=np.int64) * step,
+        "open": open_,
+        "high": np.maximum(open_, close) + spread,
+        "low": np.minimum(open_, close) - spread,
+        "close": close,
+        "volume": volume,
+        "quote_asset_volume": volume * close,
+        "number_of_trades": rng.poisson(100, n),
+        "taker_buy_base_asset_volume": taker_base,
+        "taker_buy_quote_asset_volume": taker_base * close,
+    }
+
+def klines_page(candles, start, end, step):
+    """Filas [start, end) en el formato de klines de la API de Binance (valores como texto)."""
+    rows = []
+    for i in range(start, end):
+        t = int(candles["timestamp"][i])
+        rows.append([t, repr(candles["open"][i]), repr(candles["high"][i]), repr(candles["low"][i]),
+                     repr(candles["close"][i]), repr(candles["volume"][i]), t + step - 1,
+                     repr(candles["quote_asset_volume"][i]), int(candles["number_of_trades"][i]),
+                     repr(candles["taker_buy_base_asset_volume"][i]),
+                     repr(candles["taker_buy_quote_asset_volume"][i]), "0"])
+    return rows
+
+#############################
+# API DE VELAS LOCAL Y SUSTITUTO DE BASE DE DATOS
+#############################
+
+@contextmanager
+def fake_kline_api(candles, interval):
+    """Servidor HTTP local que responde /api/v3/klines con las velas sintéticas."""
+    step = INTERVAL_MS[interval]
+    total = len(candles["timestamp"])
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            start_ms = int(query["startTime"][0])
+            limit = int(query.get("limit", ["500"])[0])
+            start = min(max(0, -(-(start_ms - START_MS) // step)), total)
+            body = json.dumps(klines_page(candles, start, min(start + limit, total), step)).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+
+class StandInCursor:
+    """Cursor mínimo que consume los datos de COPY sin base de datos (mide la preparación)."""
+
+    def __init__(self):
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        pass
+
+    def copy_expert(self, query, buffer):
+        self.rowcount = sum(1 for _ in buffer)
+
+    def close(self):
+        pass
+
+class StandInConnection:
+    def cursor(self):
+        return StandInCursor()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+@contextmanager
+def stand_in_connection():
+    yield StandInConnection()
+
+def load_ingestor():
+    """Importa 'from binance.py' (su nombre no es un identificador válido de módulo)."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "from binance.py")
+    spec = importlib.util.spec_from_file_location("ingestor", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    # Sin límite de peticiones: la API es local
+    mod.rate_limiter = mod.TokenBucket(1e12, 1e12)
+    return mod
+
+#############################
+# ETAPAS
+#############################
+
+def _timed(func, repeat):
+    """Ejecuta 'func' 'repeat' veces y devuelve el mejor tiempo (segundos) y su resultado."""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def bench_fetch_api(ingestor, candles, interval, repeat):
+    with fake_kline_api(candles, interval) as base_url:
+        def run():
+            return sum(len(page) for page in ingestor.iter_kline_pages(BENCH_SYMBOL, interval, START_MS,
+                                                                       base_url=base_url))
+        seconds, rows = _timed(run, repeat)
+    assert rows == len(candles["timestamp"]), f"Filas descargadas: {rows}"
+    return seconds
+
+def bench_ingest(ingestor, candles, interval, repeat, use_db):
+    """Tiempo de save_to_db por páginas de PAGE_LIMIT (sin contar la creación de las páginas)."""
+    step = INTERVAL_MS[interval]
+    total = len(candles["timestamp"])
+    original_connection = ingestor.connection
+    if not use_db:
+        ingestor.connection = stand_in_connection
+    try:
+        best = float("inf")
+        for _ in range(repeat):
+            if use_db:
+                clear_bench_rows(interval)
+            elapsed = 0.0
+            for start in range(0, total, ingestor.PAGE_LIMIT):
+                page = klines_page(candles, start, min(start + ingestor.PAGE_LIMIT, total), step)
+                started = time.perf_counter()
+                ingestor.save_to_db(page, BENCH_SYMBOL, interval)
+                elapsed += time.perf_counter() - started
+            best = min(best, elapsed)
+    finally:
+        ingestor.connection = original_connection
+    return best
+
+def clear_bench_rows(interval):
+    from db import connection
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute("DELETE FROM candlestick_data WHERE symbol = %s AND interval = %s;", (BENCH_SYMBOL, interval))
+        conn.commit()
+
+def bench_query(candles, interval, repeat, use_db):
+    """Lectura del rango completo: en frío (sin caché) y en caliente (caché ya poblada)."""
+    from cache import load_candles, CACHE_COLUMNS
+    start_ts = int(candles["timestamp"][0])
+    end_ts = int(candles["timestamp"][-1])
+    if use_db:
+        from db import fetch_candles
+        loader = lambda lo, hi, after: fetch_candles(BENCH_SYMBOL, interval, lo, hi, after)
+    else:
+        def loader(lo, hi, after):
+            ts = candles["timestamp"]
+            mask = ((ts > lo) if after else (ts >= lo)) & (ts <= hi)
+            return {col: candles[col][mask] for col in CACHE_COLUMNS}
+    results = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        results["query_cold"], _ = _timed(lambda: loader(start_ts, end_ts, False), repeat)
+        load_candles(cache_dir, 1 << 40, BENCH_SYMBOL, interval, start_ts, end_ts, loader)
+        results["query"], data = _timed(
+            lambda: load_candles(cache_dir, 1 << 40, BENCH_SYMBOL, interval, start_ts, end_ts, loader), repeat)
+    assert len(data["timestamp"]) == len(candles["timestamp"])
+    return results
+
+def bench_strategy(candles, repeat):
+    from estrategia import run_strategy
+    from optimizador import _load_strategy_module
+    mod = _load_strategy_module(os.path.join("estrategias", "ema.py"))
+    seconds, (signals, _) = _timed(lambda: run_strategy(mod, candles), repeat)
+    return seconds, signals
+
+def bench_backtest(candles, signals, repeat):
+    from backtest import run_backtest, MODE_NEXT_CANDLE, MODE_POSITION
+    def run():
+        run_backtest(candles["close"], signals, 1000, 10, mode=MODE_NEXT_CANDLE)
+        run_backtest(candles["close"], signals, 1000, 10, mode=MODE_POSITION)
+    seconds, _ = _timed(run, repeat)
+    return seconds
+
+def bench_render(candles, repeat, width_px=1200):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import mplfinance as mpf
+    from grafico import downsample_ohlc, get_style, PIXELS_PER_CANDLE
+    data = pd.DataFrame({col: candles[col] for col in ("open", "high", "low", "close", "volume")})
+    data["timestamp"] = pd.to_datetime(candles["timestamp"], unit="ms")
+    def run():
+        frame = downsample_ohlc(data, 0, len(data), width_px // PIXELS_PER_CANDLE)
+        fig, _ = mpf.plot(frame, type="candle", volume=True, style=get_style(), returnfig=True)
+        fig.canvas.draw()
+        plt.close(fig)
+    seconds, _ = _timed(run, repeat)
+    return seconds
+
+def run_benchmarks(sizes, interval="1m", repeat=3, use_db=False, stages=STAGES):
+    """Ejecuta las etapas indicadas para cada tamaño y devuelve el diccionario de resultados."""
+    ingestor = load_ingestor() if {"fetch_api", "ingest"} & set(stages) else None
+    results = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "database": "postgresql" if use_db else "stand-in",
+            "interval": interval,
+            "repeat": repeat,
+        },
+        "results": {},
+    }
+    for n in sizes:
+        candles = synthetic_candles(n, interval)
+        timings = {}
+        if "fetch_api" in stages:
+            timings["fetch_api"] = bench_fetch_api(ingestor, candles, interval, repeat)
+        if "ingest" in stages:
+            timings["ingest"] = bench_ingest(ingestor, candles, interval, repeat, use_db)
+        if "query" in stages:
+            timings.update(bench_query(candles, interval, repeat, use_db))
+        signals = None
+        if "strategy" in stages or "backtest" in stages:
+            timings["strategy"], signals = bench_strategy(candles, repeat)
+        if "backtest" in stages:
+            timings["backtest"] = bench_backtest(candles, signals, repeat)
+        if "render" in stages:
+            timings["render"] = bench_render(candles, repeat)
+        timings["total"] = sum(seconds for stage, seconds in timings.items() if stage in STAGES)
+        results["results"][str(n)] = {
+            "seconds": timings,
+            "rows_per_second": {stage: n / seconds for stage, seconds in timings.items() if seconds > 0},
+        }
+        print(f"{n:>10,} filas | " + " | ".join(f"{stage}: {seconds:.3f}s" for stage, seconds in timings.items()))
+    return results
+
+#############################
+# COMPARACIÓN CON LA REFERENCIA
+#############################
+
+def compare(results, baseline, tolerance):
+    """
+    Compara cada etapa con la referencia. Devuelve la lista de regresiones
+    (tamaño, etapa, segundos actuales, segundos de referencia) que superan 'tolerance'.
+    """
+    regressions = []
+    for size, current in results["results"].items():
+        reference = baseline.get("results", {}).get(size)
+        if reference is None:
+            continue
+        for stage, seconds in current["seconds"].items():
+            base_seconds = reference["seconds"].get(stage)
+            if base_seconds is None:
+                continue
+            ratio = seconds / base_seconds if base_seconds else float("inf")
+            marker = "REGRESIÓN" if ratio > 1 + tolerance else ""
+            print(f"{size:>10} {stage:<11} {base_seconds:9.3f}s -> {seconds:9.3f}s ({ratio:5.2f}x) {marker}")
+            if marker:
+                regressions.append((size, stage, seconds, base_seconds))
+    return regressions
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Benchmarks de ingesta, consulta, estrategia, backtest y gráfico.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES,
+                        help="Número de velas sintéticas (de 10k a 5M).")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--interval", default="1m")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones por etapa (se guarda la mejor).")
+    parser.add_argument("--db", action="store_true", help="Usar la base de datos PostgreSQL configurada.")
+    parser.add_argument("--output", default="bench_results.json", help="Archivo JSON de resultados.")
+    parser.add_argument("--baseline", default="bench_baseline.json", help="Archivo JSON de referencia.")
+    parser.add_argument("--save-baseline", action="store_true", help="Guardar estos resultados como referencia.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Empeoramiento relativo permitido antes de marcar una regresión.")
+    return parser
+
+if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+    results = run_benchmarks(args.sizes, args.interval, args.repeat, args.db, args.stages)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Resultados guardados en {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Referencia guardada en {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
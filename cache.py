@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+import numpy as np
+
+#############################
+# CACHÉ LOCAL DE VELAS EN COLUMNAS
+#############################
+#
+# Cada (símbolo, intervalo) se guarda en su propia carpeta con un archivo binario
+# por columna (timestamp int64 y OHLCV float64) y un 'meta.json' con el número de
+# filas válidas y el rango ya consultado a la base de datos. Las lecturas mapean
+# los archivos en memoria y cortan el rango con searchsorted, sin copiar el resto.
+
+CACHE_COLUMNS = {
+    "timestamp": np.int64,
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "volume": np.float64,
+}
+
+_cache_lock = threading.Lock()
+
+def _key_dir(cache_dir, symbol, interval):
+    return os.path.join(cache_dir, f"{symbol}_{interval}")
+
+def _read_meta(path):
+    try:
+        with open(os.path.join(path, "meta.json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _write_meta(path, meta):
+    """Escribe meta.json de forma atómica; solo entonces las filas nuevas pasan a ser válidas."""
+    tmp_path = os.path.join(path, "meta.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(path, "meta.json"))
+
+def _open_columns(path, rows):
+    """Mapea en memoria las primeras 'rows' filas de cada columna (solo lectura)."""
+    if rows == 0:
+        return {col: np.empty(0, dtype=dtype) for col, dtype in CACHE_COLUMNS.items()}
+    return {col: np.memmap(os.path.join(path, f"{col}.bin"), dtype=dtype, mode="r", shape=(rows,))
+            for col, dtype in CACHE_COLUMNS.items()}
+
+def _append_columns(path, rows, data):
+    """Añade filas al final de cada columna, truncando antes cualquier escritura incompleta."""
+    for col, dtype in CACHE_COLUMNS.items():
+        file_path = os.path.join(path, f"{col}.bin")
+        with open(file_path, "ab") as f:
+            f.truncate(rows * np.dtype(dtype).itemsize)
+            f.write(np.ascontiguousarray(data[col], dtype=dtype).tobytes())
+
+def _rewrite_columns(path, data):
+    """Reescribe todas las columnas (se usa al ampliar la caché hacia fechas anteriores)."""
+    for col, dtype in CACHE_COLUMNS.items():
+        tmp_path = os.path.join(path, f"{col}.bin.tmp")
+        np.ascontiguousarray(data[col], dtype=dtype).tofile(tmp_path)
+        os.replace(tmp_path, os.path.join(path, f"{col}.bin"))
+
+def _dir_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+def evict_lru(cache_dir, max_bytes, keep=None):
+    """Elimina las entradas usadas hace más tiempo hasta que la caché ocupa menos de 'max_bytes'."""
+    if not os.path.isdir(cache_dir):
+        return
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_dir():
+            meta = _read_meta(entry.path) or {}
+            entries.append((meta.get("last_access", 0), entry.path, _dir_size(entry.path)))
+    total = sum(size for _, _, size in entries)
+    for _, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        logging.info(f"Caché: eliminada la entrada {os.path.basename(path)} ({size / 1e6:.1f} MB).")
+
+def drop_entry(cache_dir, symbol, interval):
+    """
+    Elimina la entrada de (symbol, interval) para que la próxima lectura la reconstruya
+    desde la base de datos. Se renombra antes de borrarla para que otro proceso nunca
+    vea una entrada a medio eliminar.
+    """
+    path = _key_dir(cache_dir, symbol, interval)
+    stale_path = f"{path}.stale-{os.getpid()}-{time.monotonic_ns()}"
+    with _cache_lock:
+        try:
+            os.rename(path, stale_path)
+        except FileNotFoundError:
+            return False
+    shutil.rmtree(stale_path, ignore_errors=True)
+    logging.info(f"Caché: invalidada la entrada {os.path.basename(path)}.")
+    return True
+
+def load_candles(cache_dir, max_bytes, symbol, interval, start_ts, end_ts, loader):
+    """
+    Devuelve un dict de arrays con las velas de [start_ts, end_ts] usando la caché local.
+    'loader(start_ts, end_ts, after)' consulta la base de datos y devuelve un dict de
+    arrays con las columnas de CACHE_COLUMNS; con after=True el límite inferior es exclusivo.
+    Solo se consultan las velas desde la última cacheada, incluida y reescrita porque
+    puede seguir abierta (y, si se piden fechas anteriores al rango cacheado, ese tramo
+    inicial). Las velas escritas por detrás de la última (p. ej. huecos rellenados) no
+    se detectan: quien las escribe debe llamar a drop_entry.
+    """
+    with _cache_lock:
+        path = _key_dir(cache_dir, symbol, interval)
+        os.makedirs(path, exist_ok=True)
+        meta = _read_meta(path) or {"rows": 0, "covered_from": None}
+        rows = meta["rows"]
+        columns = _open_columns(path, rows)
+
+        if rows == 0 or meta["covered_from"] is None:
+            # Caché vacía: se carga el rango pedido
+            new = loader(start_ts, end_ts, False)
+            _rewrite_columns(path, new)
+            rows = len(new["timestamp"])
+            meta["covered_from"] = start_ts
+        else:
+            if start_ts < meta["covered_from"]:
+                # Ampliar hacia atrás: cargar el tramo inicial y reescribir las columnas
+                head = loader(start_ts, meta["covered_from"], False)
+                head_mask = head["timestamp"] < (columns["timestamp"][0] if rows else meta["covered_from"])
+                merged = {col: np.concatenate((np.asarray(head[col])[head_mask], columns[col]))
+                          for col in CACHE_COLUMNS}
+                columns = None  # Liberar el mapeo antes de reemplazar los archivos
+                _rewrite_columns(path, merged)
+                rows = len(merged["timestamp"])
+                meta["covered_from"] = start_ts
+                columns = _open_columns(path, rows)
+            tail_ts = int(columns["timestamp"][-1]) if rows else meta["covered_from"] - 1
+            if end_ts >= tail_ts:
+                # La última vela cacheada se vuelve a leer (los agregados la reescriben
+                # mientras está abierta) junto con las más nuevas
+                new = loader(tail_ts, end_ts, False)
+                if len(new["timestamp"]):
+                    keep = rows - 1 if rows and new["timestamp"][0] == tail_ts else rows
+                    columns = None
+                    _append_columns(path, keep, new)
+                    rows = keep + len(new["timestamp"])
+
+        meta["rows"] = rows
+        meta["last_access"] = time.time()
+        _write_meta(path, meta)
+        columns = _open_columns(path, rows)
+        lo = np.searchsorted(columns["timestamp"], start_ts, side="left")
+        hi = np.searchsorted(columns["timestamp"], end_ts, side="right")
+        result = {col: np.array(values[lo:hi]) for col, values in columns.items()}
+        del columns
+        evict_lru(cache_dir, max_bytes, keep=path)
+    return result
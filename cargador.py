@@ -0,0 +1,152 @@
+import os
+import ast
+import json
+import logging
+import importlib.util
+from collections.abc import Mapping
+
+#############################
+# DESCUBRIMIENTO Y CARGA PEREZOSA DE ESTRATEGIAS
+#############################
+#
+# Los nombres de las estrategias se obtienen leyendo el código de cada archivo de
+# 'estrategias' (sin ejecutarlo) y se guardan en un manifiesto indexado por la
+# fecha de modificación, así que solo se vuelven a analizar los archivos que
+# cambian. Cada módulo se importa la primera vez que se usa su estrategia y se
+# recarga automáticamente cuando su archivo se modifica.
+
+STRATEGY_FOLDER = "estrategias"
+MANIFEST_NAME = ".manifest.json"
+
+def is_strategy_module(mod):
+    """Indica si un módulo cumple el contrato nuevo o el antiguo."""
+    return hasattr(mod, "strategy_name") and (hasattr(mod, "generate_signals") or hasattr(mod, "apply_strategy"))
+
+def _import_file(path):
+    """Ejecuta un archivo de estrategia como módulo independiente."""
+    module_name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+def _read_strategy_name(path):
+    """
+    Obtiene 'strategy_name' analizando el código sin ejecutarlo. Si no es un texto
+    literal, se importa el módulo. Devuelve None si el archivo no es una estrategia.
+    """
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    name = None
+    functions = set()
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == "strategy_name" for t in node.targets):
+            if isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+                name = node.value.value
+            else:
+                mod = _import_file(path)
+                return mod.strategy_name if is_strategy_module(mod) else None
+        elif isinstance(node, ast.FunctionDef):
+            functions.add(node.name)
+    if name is None or not functions & {"generate_signals", "apply_strategy"}:
+        return None
+    return name
+
+def discover_strategies(folder=STRATEGY_FOLDER):
+    """
+    Devuelve {strategy_name: ruta} de los archivos de 'folder' usando el manifiesto.
+    Solo se analizan los archivos nuevos o modificados desde la última vez.
+    """
+    if not os.path.isdir(folder):
+        logging.error(f"No se encontró la carpeta '{folder}'.")
+        return {}
+    manifest_path = os.path.join(folder, MANIFEST_NAME)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+
+    entries = {}
+    changed = False
+    for file in sorted(os.listdir(folder)):
+        if not file.endswith(".py") or file == "__init__.py":
+            continue
+        path = os.path.join(folder, file)
+        mtime = os.stat(path).st_mtime
+        entry = manifest.get(file)
+        if entry is None or entry["mtime"] != mtime:
+            try:
+                entry = {"mtime": mtime, "name": _read_strategy_name(path)}
+            except Exception as e:
+                logging.error(f"Error al analizar {file}: {e}")
+                entry = {"mtime": mtime, "name": None}
+            if entry["name"] is None:
+                logging.warning(f"El módulo {file[:-3]} no define 'strategy_name' y 'generate_signals' o 'apply_strategy'.")
+            changed = True
+        entries[file] = entry
+    if changed or set(entries) != set(manifest):
+        try:
+            with open(manifest_path, "w") as f:
+                json.dump(entries, f)
+        except OSError as e:
+            logging.warning(f"No se pudo guardar el manifiesto de estrategias: {e}")
+    return {entry["name"]: os.path.join(folder, file) for file, entry in entries.items() if entry["name"]}
+
+class StrategyCatalog(Mapping):
+    """
+    Diccionario {strategy_name: módulo} que importa cada módulo al pedirlo y lo
+    recarga si su archivo cambió desde la última importación.
+    """
+
+    def __init__(self, folder=STRATEGY_FOLDER):
+        self.folder = folder
+        self.modules = {}    # strategy_name -> (mtime, módulo)
+        self.refresh()
+
+    def refresh(self):
+        """Vuelve a leer los nombres disponibles (usa el manifiesto en caché)."""
+        self.paths = discover_strategies(self.folder)
+        return list(self.paths)
+
+    def __getitem__(self, name):
+        path = self.paths[name]
+        mtime = os.stat(path).st_mtime
+        cached = self.modules.get(name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        mod = _import_file(path)
+        if not is_strategy_module(mod):
+            raise KeyError(name)
+        self.modules[name] = (mtime, mod)
+        logging.info(f"Estrategia {'recargada' if cached else 'cargada'}: {mod.strategy_name}")
+        return mod
+
+    def __contains__(self, name):
+        # Sin importar el módulo: 'in' no debe ejecutar código de la estrategia
+        return name in self.paths
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+def load_strategies(folder=STRATEGY_FOLDER):
+    """
+    Escanea la carpeta 'estrategias' y carga los módulos de estrategia.
+    Se espera que cada módulo tenga:
+      - Una variable 'strategy_name' (string)
+      - Una función 'generate_signals(data, **params)' que devuelve (señales int8, indicadores),
+        o bien la antigua 'apply_strategy(data)' que devuelve el DataFrame con señales de texto.
+    Retorna un diccionario {strategy_name: module}. Para cargar solo la estrategia
+    que se use, utilizar StrategyCatalog.
+    """
+    catalog = StrategyCatalog(folder)
+    strategies = {}
+    for name in catalog:
+        try:
+            strategies[name] = catalog[name]
+        except Exception as e:
+            logging.error(f"Error al cargar {name}: {e}")
+    return strategies
@@ -0,0 +1,96 @@
+import os
+import configparser
+
+#############################
+# CONFIGURACIÓN DEL PROYECTO
+#############################
+#
+# Los valores se leen, por orden de prioridad, de:
+#   1. Variables de entorno CRIPTO_<SECCION>_<CLAVE> (p. ej. CRIPTO_DATABASE_HOST)
+#   2. El archivo indicado en CRIPTO_CONFIG (por defecto 'config.ini')
+#   3. Los valores por defecto de DEFAULTS
+
+DEFAULTS = {
+    "database": {
+        "dbname": "cripto_db",
+        "user": "cripto_user",
+        "password": "",     # Sin valor por defecto: config.ini o CRIPTO_DATABASE_PASSWORD
+        "host": "localhost",
+        "port": "5432",
+        "pool_min": "1",
+        "pool_max": "10",
+        "health_check_seconds": "30",
+    },
+    "cache": {
+        "enabled": "true",
+        "dir": "cache",
+        "max_mb": "2048",
+    },
+    "rollups": {
+        "materialized": "5m,15m,30m,1h,1d",
+        "adhoc": "2h,4h,6h,8h,12h,3d,1w",
+    },
+    "indicators": {
+        "enabled": "true",
+        "dir": "indicators",
+    },
+}
+
+CONFIG_PATH = os.environ.get("CRIPTO_CONFIG", "config.ini")
+
+def load_config(path=CONFIG_PATH):
+    """Carga la configuración combinando valores por defecto, archivo y entorno."""
+    parser = configparser.ConfigParser()
+    parser.read_dict(DEFAULTS)
+    parser.read(path)
+    for section in parser.sections():
+        for key in parser[section]:
+            env_name = f"CRIPTO_{section}_{key}".upper()
+            if env_name in os.environ:
+                parser[section][key] = os.environ[env_name]
+    return parser
+
+def database_settings(config=None):
+    """Parámetros de conexión de psycopg2 y del pool para la sección [database]."""
+    section = (config or load_config())["database"]
+    if not section["password"]:
+        raise ValueError("Falta la contraseña de la base de datos: defínela en [database] password "
+                         "de config.ini o en la variable de entorno CRIPTO_DATABASE_PASSWORD.")
+    return {
+        "connect": {
+            "dbname": section["dbname"],
+            "user": section["user"],
+            "password": section["password"],
+            "host": section["host"],
+            "port": section.getint("port"),
+        },
+        "pool_min": section.getint("pool_min"),
+        "pool_max": section.getint("pool_max"),
+        "health_check_seconds": section.getfloat("health_check_seconds"),
+    }
+
+def cache_settings(config=None):
+    """Configuración de la caché local de velas (sección [cache])."""
+    section = (config or load_config())["cache"]
+    return {
+        "enabled": section.getboolean("enabled"),
+        "dir": section["dir"],
+        "max_bytes": int(section.getfloat("max_mb") * 1024 * 1024),
+    }
+
+def rollup_settings(config=None):
+    """Intervalos agregados a partir de velas de 1m (sección [rollups])."""
+    section = (config or load_config())["rollups"]
+    split = lambda value: [item.strip() for item in value.split(",") if item.strip()]
+    return {
+        "materialized": split(section["materialized"]),
+        "adhoc": split(section["adhoc"]),
+    }
+
+def indicator_settings(config=None):
+    """Configuración del motor incremental de indicadores (sección [indicators])."""
+    section = (config or load_config())["indicators"]
+    return {
+        "enabled": section.getboolean("enabled"),
+        "dir": section["dir"],
+    }
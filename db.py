@@ -0,0 +1,194 @@
+import io
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
+from config import database_settings, cache_settings, rollup_settings
+from intervalos import INTERVAL_MS, bucket_start, resample_candles
+from cache import load_candles, drop_entry, CACHE_COLUMNS
+
+#############################
+# POOL DE CONEXIONES COMPARTIDO
+#############################
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_slots = None          # Semáforo que limita las conexiones en uso a pool_max
+_last_used = {}             # id(conexión) -> último momento en que se devolvió al pool
+_settings = None
+_in_use = {}                # id del hilo -> conexiones que está usando (para cancel_queries)
+
+def get_pool():
+    """Crea el pool de conexiones la primera vez que se necesita y lo reutiliza después."""
+    global _pool, _pool_slots, _settings
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _settings = database_settings()
+                try:
+                    _pool = ThreadedConnectionPool(_settings["pool_min"], _settings["pool_max"],
+                                                   **_settings["connect"])
+                except Exception as e:
+                    logging.error(f"Error al conectar a la base de datos: {e}")
+                    raise
+                _pool_slots = threading.BoundedSemaphore(_settings["pool_max"])
+    return _pool
+
+def close_pool():
+    """Cierra todas las conexiones del pool (por ejemplo al salir de la aplicación)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+
+def _is_healthy(conn):
+    """Comprueba la conexión si lleva inactiva más de 'health_check_seconds'."""
+    if conn.closed:
+        return False
+    idle = time.monotonic() - _last_used.get(id(conn), 0)
+    if idle < _settings["health_check_seconds"]:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+@contextmanager
+def connection():
+    """
+    Toma una conexión del pool durante el bloque 'with' y la devuelve al salir.
+    Si el bloque lanza una excepción se hace rollback de la transacción pendiente.
+    Si todas las conexiones están en uso, espera a que se libere una.
+    """
+    pool = get_pool()
+    _pool_slots.acquire()
+    conn = None
+    try:
+        conn = pool.getconn()
+        if not _is_healthy(conn):
+            logging.warning("Conexión a la base de datos inválida. Se reemplaza.")
+            _last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+        with _pool_lock:
+            _in_use.setdefault(threading.get_ident(), set()).add(conn)
+        yield conn
+    except Exception:
+        if conn is not None and not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        if conn is not None:
+            with _pool_lock:
+                thread_conns = _in_use.get(threading.get_ident(), set())
+                thread_conns.discard(conn)
+                if not thread_conns:
+                    _in_use.pop(threading.get_ident(), None)
+            broken = conn.closed or conn.get_transaction_status() == extensions.TRANSACTION_STATUS_UNKNOWN
+            if broken:
+                _last_used.pop(id(conn), None)
+            else:
+                _last_used[id(conn)] = time.monotonic()
+            pool.putconn(conn, close=broken)
+        _pool_slots.release()
+
+def cancel_queries(thread_id):
+    """
+    Cancela desde otro hilo las consultas en curso de las conexiones que usa el hilo
+    'thread_id'. La consulta cancelada lanza QueryCanceledError en ese hilo.
+    """
+    with _pool_lock:
+        conns = list(_in_use.get(thread_id, ()))
+    for conn in conns:
+        try:
+            conn.cancel()
+        except psycopg2.Error as e:
+            logging.warning(f"No se pudo cancelar la consulta: {e}")
+
+#############################
+# CONSULTAS COMPARTIDAS
+#############################
+
+def date_to_timestamp(date_str):
+    """Convierte una fecha (YYYY-MM-DD) a timestamp en milisegundos."""
+    date_obj = datetime.strptime(date_str, '%Y-%m-%d')
+    timestamp = int(date_obj.timestamp() * 1000)
+    return timestamp
+
+def fetch_candles(symbol, interval, start_ts, end_ts, after=False):
+    """
+    Lee las velas de [start_ts, end_ts] como un dict de arrays por columna.
+    Con after=True el límite inferior es exclusivo (timestamp > start_ts).
+    Los datos se transfieren con COPY ... TO STDOUT en lugar de fetchall() de tuplas.
+    """
+    lower = ">" if after else ">="
+    with connection() as conn, conn.cursor() as cursor:
+        query = cursor.mogrify(f"""
+            SELECT timestamp, open, high, low, close, volume
+            FROM candlestick_data
+            WHERE symbol = %s AND interval = %s AND timestamp {lower} %s AND timestamp <= %s
+            ORDER BY timestamp
+        """, (symbol, interval, start_ts, end_ts)).decode()
+        buffer = io.StringIO()
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", buffer)
+    buffer.seek(0)
+    frame = pd.read_csv(buffer, header=None, names=list(CACHE_COLUMNS), dtype=CACHE_COLUMNS)
+    return {col: frame[col].to_numpy() for col in CACHE_COLUMNS}
+
+def invalidate_cache(symbol, intervals):
+    """Elimina de la caché local las velas de 'symbol' en 'intervals' (p. ej. tras rellenar huecos)."""
+    cache_dir = cache_settings()["dir"]
+    for interval in intervals:
+        drop_entry(cache_dir, symbol, interval)
+
+def fetch_data_from_db(symbol, interval, start_date, end_date, use_cache=None):
+    """
+    Devuelve un DataFrame con las velas del rango indicado.
+    Si la caché está activa se lee de la caché local y solo se consultan a la base
+    de datos las velas que aún no están cacheadas.
+    Los intervalos configurados como 'adhoc' (p. ej. 4h o 3d) no se guardan: se
+    construyen en memoria a partir de las velas de 1m.
+    """
+    try:
+        start_ts = date_to_timestamp(start_date)
+        end_ts = date_to_timestamp(end_date)
+        target_interval = interval
+        if interval in rollup_settings()["adhoc"]:
+            # Empezar en la apertura de la primera vela agregada y terminar al cierre de la
+            # última (como las velas guardadas, que incluyen la que abre en end_ts)
+            start_ts = int(bucket_start(start_ts, interval))
+            end_ts = int(bucket_start(end_ts, interval)) + INTERVAL_MS[interval] - 1
+            interval = "1m"
+        settings = cache_settings()
+        if use_cache is None:
+            use_cache = settings["enabled"]
+        if use_cache:
+            loader = lambda lo, hi, after: fetch_candles(symbol, interval, lo, hi, after)
+            columns = load_candles(settings["dir"], settings["max_bytes"], symbol, interval,
+                                   start_ts, end_ts, loader)
+        else:
+            columns = fetch_candles(symbol, interval, start_ts, end_ts)
+        if target_interval != interval:
+            columns = resample_candles(columns, target_interval)
+        data = pd.DataFrame(columns)
+        # Convertir a datetime
+        data['timestamp'] = pd.to_datetime(data['timestamp'], unit='ms')
+        # Identificar la serie para el motor incremental de indicadores
+        data.attrs.update(symbol=symbol, interval=target_interval)
+        return data
+    except extensions.QueryCanceledError:
+        logging.info(f"Consulta de {symbol} ({target_interval}) cancelada.")
+        return None
+    except Exception as e:
+        logging.error(f"Error al obtener datos de la base de datos: {e}")
+        return None
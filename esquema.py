@@ -0,0 +1,350 @@
+import argparse
+import logging
+import threading
+from datetime import datetime, timezone
+from psycopg2 import sql
+from db import connection
+from intervalos import INTERVAL_MS
+
+# Configuración de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+#############################
+# ESQUEMA DE candlestick_data
+#############################
+#
+# La tabla se particiona por lista de 'interval' y cada intervalo por rangos de
+# 'timestamp' (meses naturales en UTC). Así las consultas de un (símbolo, intervalo)
+# solo tocan las particiones de ese intervalo y del rango pedido, y el tamaño de
+# cada índice se mantiene acotado aunque la tabla crezca a miles de millones de filas.
+#
+# La clave primaria (symbol, interval, timestamp) sirve para ON CONFLICT, para el
+# MAX(timestamp) de get_last_timestamp (un descenso del índice) y, con INCLUDE de
+# las columnas OHLCV, para leer los rangos de fetch_candles solo desde el índice.
+#
+# Las columnas de 8 bytes van primero y los textos al final para evitar relleno
+# por alineación; los precios y volúmenes son double precision en lugar de numeric.
+
+TABLE = "candlestick_data"
+LEGACY_TABLE = "candlestick_data_legacy"
+
+# Columnas en el orden físico de la tabla
+COLUMN_TYPES = {
+    "timestamp": "BIGINT NOT NULL",
+    "open": "DOUBLE PRECISION",
+    "high": "DOUBLE PRECISION",
+    "low": "DOUBLE PRECISION",
+    "close": "DOUBLE PRECISION",
+    "volume": "DOUBLE PRECISION",
+    "quote_asset_volume": "DOUBLE PRECISION",
+    "taker_buy_base_asset_volume": "DOUBLE PRECISION",
+    "taker_buy_quote_asset_volume": "DOUBLE PRECISION",
+    "number_of_trades": "INTEGER",
+    "symbol": "VARCHAR(20) NOT NULL",
+    "interval": "VARCHAR(4) NOT NULL",
+}
+
+# Meses por partición de rango según el intervalo (divisores de 12)
+PARTITION_MONTHS = {"1m": 1, "3m": 1, "5m": 3, "15m": 6}
+DEFAULT_PARTITION_MONTHS = 12
+# Meses futuros para los que se crean particiones por adelantado
+AHEAD_MONTHS = 3
+# Segundos entre revisiones de particiones en los procesos de ingesta continua
+MAINTENANCE_SECONDS = 24 * 60 * 60
+# Velas por símbolo copiadas en cada lote de la migración
+MIGRATION_CHUNK_CANDLES = 10_000
+
+def _suffix(interval):
+    """Sufijo de tabla para un intervalo ('1M' mensual se distingue de '1m')."""
+    return interval.replace("M", "mo").lower()
+
+def interval_table(interval):
+    return f"{TABLE}_{_suffix(interval)}"
+
+def _to_ms(dt):
+    return int(dt.timestamp() * 1000)
+
+def _partition_bounds(timestamp_ms, interval):
+    """Devuelve (inicio_ms, fin_ms, etiqueta) del tramo de meses que contiene 'timestamp_ms'."""
+    months = PARTITION_MONTHS.get(interval, DEFAULT_PARTITION_MONTHS)
+    date = datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc)
+    month = (date.month - 1) // months * months + 1
+    start = datetime(date.year, month, 1, tzinfo=timezone.utc)
+    end_month = month + months
+    end = datetime(date.year + (end_month - 1) // 12, (end_month - 1) % 12 + 1, 1, tzinfo=timezone.utc)
+    label = f"{start.year}" if months == 12 else f"{start.year}_{start.month:02d}"
+    return _to_ms(start), _to_ms(end), label
+
+def _exists(cursor, name):
+    cursor.execute("SELECT to_regclass(%s);", (name,))
+    return cursor.fetchone()[0] is not None
+
+def _relkind(cursor, name):
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s);", (name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def create_table(cursor):
+    """Crea la tabla particionada y una partición por cada intervalo conocido."""
+    columns = sql.SQL(", ").join(
+        sql.SQL("{} {}").format(sql.Identifier(name), sql.SQL(kind)) for name, kind in COLUMN_TYPES.items())
+    cursor.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {table} (
+            {columns},
+            CONSTRAINT {pk} PRIMARY KEY (symbol, interval, timestamp)
+                INCLUDE (open, high, low, close, volume)
+        ) PARTITION BY LIST (interval);
+    """).format(table=sql.Identifier(TABLE), columns=columns, pk=sql.Identifier(f"{TABLE}_pk")))
+    # Intervalos no previstos: se guardan sin subparticiones
+    cursor.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} DEFAULT;").format(
+        sql.Identifier(f"{TABLE}_other"), sql.Identifier(TABLE)))
+    for interval in INTERVAL_MS:
+        create_interval_partition(cursor, interval)
+
+def create_interval_partition(cursor, interval):
+    """Crea la partición de 'interval' (subparticionada por rango) con su partición por defecto."""
+    table = interval_table(interval)
+    cursor.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES IN (%s) PARTITION BY RANGE (timestamp);
+    """).format(sql.Identifier(table), sql.Identifier(TABLE)), (interval,))
+    # Recoge las velas fuera de las particiones creadas hasta que se cree la suya
+    cursor.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} DEFAULT;").format(
+        sql.Identifier(f"{table}_default"), sql.Identifier(table)))
+
+def ensure_partitions(cursor, interval, start_ms, end_ms):
+    """
+    Crea las particiones de rango de 'interval' que cubren [start_ms, end_ms].
+    Si la partición por defecto ya tiene velas de un tramo nuevo, se mueven a la
+    partición nueva antes de adjuntarla. Devuelve las particiones creadas.
+    """
+    parent = interval_table(interval)
+    default = f"{parent}_default"
+    created = []
+    lower = start_ms
+    while lower <= end_ms:
+        lo, hi, label = _partition_bounds(lower, interval)
+        name = f"{parent}_{label}"
+        if not _exists(cursor, name):
+            cursor.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS);").format(
+                sql.Identifier(name), sql.Identifier(parent)))
+            cursor.execute(sql.SQL("""
+                WITH moved AS (
+                    DELETE FROM {default} WHERE timestamp >= %s AND timestamp < %s RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved;
+            """).format(default=sql.Identifier(default), name=sql.Identifier(name)), (lo, hi))
+            if cursor.rowcount:
+                logging.info(f"{cursor.rowcount} velas movidas de {default} a {name}.")
+            cursor.execute(sql.SQL("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s);").format(
+                sql.Identifier(parent), sql.Identifier(name)), (lo, hi))
+            created.append(name)
+        lower = hi
+    return created
+
+def ensure_upcoming_partitions(ahead_months=AHEAD_MONTHS):
+    """Crea las particiones desde el mes actual hasta 'ahead_months' meses después para cada intervalo."""
+    now = datetime.now(timezone.utc)
+    end_month = now.month + ahead_months
+    end = datetime(now.year + (end_month - 1) // 12, (end_month - 1) % 12 + 1, 1, tzinfo=timezone.utc)
+    created = []
+    with connection() as conn, conn.cursor() as cursor:
+        if _relkind(cursor, TABLE) != "p":
+            logging.info(f"{TABLE} no está particionada; ejecuta 'python esquema.py migrate'.")
+            conn.rollback()
+            return created
+        for interval in INTERVAL_MS:
+            if _exists(cursor, interval_table(interval)):
+                created += ensure_partitions(cursor, interval, _to_ms(now), _to_ms(end) - 1)
+        conn.commit()
+    if created:
+        logging.info(f"Particiones creadas: {', '.join(created)}")
+    return created
+
+# Tramos (intervalo, inicio_ms) ya comprobados en este proceso, para no consultar
+# la base de datos en cada página descargada
+_ensured = set()
+_ensured_lock = threading.Lock()
+
+def ensure_range_partitions(interval, start_ms, end_ms):
+    """
+    Crea las particiones de 'interval' que cubren [start_ms, end_ms] antes de escribir
+    ese tramo, para que un relleno histórico no acabe en la partición por defecto.
+    Devuelve las particiones creadas.
+    """
+    with _ensured_lock:
+        bounds = []
+        lower = start_ms
+        while lower <= end_ms:
+            lo, hi, _ = _partition_bounds(lower, interval)
+            if (interval, lo) not in _ensured:
+                bounds.append(lo)
+            lower = hi
+        if not bounds:
+            return []
+        created = []
+        with connection() as conn, conn.cursor() as cursor:
+            # Sin tabla particionada (o sin partición del intervalo) no hay nada que crear
+            if _relkind(cursor, TABLE) == "p" and _exists(cursor, interval_table(interval)):
+                created = ensure_partitions(cursor, interval, bounds[0], end_ms)
+            conn.commit()
+        _ensured.update((interval, lo) for lo in bounds)
+    if created:
+        logging.info(f"Particiones creadas: {', '.join(created)}")
+    return created
+
+def start_partition_maintenance(interval_seconds=MAINTENANCE_SECONDS, stop_event=None):
+    """
+    Crea las particiones próximas ahora y después cada 'interval_seconds' desde un hilo
+    en segundo plano, para que un proceso de ingesta que dure meses nunca escriba en
+    las particiones por defecto.
+    """
+    stop_event = stop_event or threading.Event()
+
+    def loop():
+        while True:
+            try:
+                ensure_upcoming_partitions()
+            except Exception as e:
+                logging.error(f"No se pudieron crear las particiones: {e}")
+            if stop_event.wait(interval_seconds):
+                return
+
+    thread = threading.Thread(target=loop, daemon=True, name="particiones")
+    thread.start()
+    return thread
+
+#############################
+# MIGRACIONES
+#############################
+#
+# Las migraciones aplicadas se anotan en 'schema_version'. La copia de la tabla
+# antigua se hace por lotes de (intervalo, rango de timestamps) con un commit por
+# lote y el progreso guardado en 'candlestick_migration', de modo que si se
+# interrumpe se reanuda desde el último lote copiado.
+
+def _copy_legacy(conn, chunk_candles):
+    """Copia las velas de la tabla antigua a la particionada por lotes reanudables."""
+    columns = list(COLUMN_TYPES)
+    column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+    # Conversión explícita por si la tabla antigua usa numeric o text
+    casted = sql.SQL(", ").join(
+        sql.SQL("{}::{}").format(sql.Identifier(name), sql.SQL(kind.replace(" NOT NULL", "")))
+        for name, kind in COLUMN_TYPES.items())
+    insert = sql.SQL("""
+        INSERT INTO {table} ({columns})
+        SELECT {casted} FROM {legacy}
+        WHERE interval = %s AND timestamp >= %s AND timestamp < %s
+        ON CONFLICT (symbol, interval, timestamp) DO NOTHING;
+    """).format(table=sql.Identifier(TABLE), columns=column_list, casted=casted,
+                legacy=sql.Identifier(LEGACY_TABLE))
+
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS candlestick_migration (
+                interval VARCHAR(4) PRIMARY KEY,
+                migrated_until BIGINT NOT NULL
+            );
+        """)
+        cursor.execute(sql.SQL("SELECT interval, MIN(timestamp), MAX(timestamp) FROM {} GROUP BY interval;").format(
+            sql.Identifier(LEGACY_TABLE)))
+        ranges = cursor.fetchall()
+        cursor.execute("SELECT interval, migrated_until FROM candlestick_migration;")
+        progress = dict(cursor.fetchall())
+        conn.commit()
+
+        for interval, first_ts, last_ts in ranges:
+            if not _exists(cursor, interval_table(interval)):
+                create_interval_partition(cursor, interval)
+            ensure_partitions(cursor, interval, first_ts, last_ts)
+            conn.commit()
+            step = INTERVAL_MS.get(interval, INTERVAL_MS["1d"]) * chunk_candles
+            lower = max(first_ts, progress.get(interval, first_ts))
+            copied = 0
+            while lower <= last_ts:
+                upper = lower + step
+                cursor.execute(insert, (interval, lower, upper))
+                copied += cursor.rowcount
+                cursor.execute("""
+                    INSERT INTO candlestick_migration (interval, migrated_until) VALUES (%s, %s)
+                    ON CONFLICT (interval) DO UPDATE SET migrated_until = EXCLUDED.migrated_until;
+                """, (interval, upper))
+                conn.commit()
+                lower = upper
+            logging.info(f"Intervalo {interval}: {copied} velas copiadas.")
+        cursor.execute("DROP TABLE candlestick_migration;")
+        conn.commit()
+
+def _migration_partitioned_table(conn, chunk_candles=MIGRATION_CHUNK_CANDLES, drop_legacy=False):
+    """Crea candlestick_data particionada y copia, si existe, la tabla creada a mano."""
+    with conn.cursor() as cursor:
+        kind = _relkind(cursor, TABLE)
+        if kind == "r":
+            logging.info(f"Renombrando la tabla existente a {LEGACY_TABLE}.")
+            cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {};").format(
+                sql.Identifier(TABLE), sql.Identifier(LEGACY_TABLE)))
+        if kind != "p":
+            create_table(cursor)
+        conn.commit()
+        legacy = _exists(cursor, LEGACY_TABLE)
+    if legacy:
+        _copy_legacy(conn, chunk_candles)
+        if drop_legacy:
+            with conn.cursor() as cursor:
+                cursor.execute(sql.SQL("DROP TABLE {};").format(sql.Identifier(LEGACY_TABLE)))
+            conn.commit()
+    with conn.cursor() as cursor:
+        cursor.execute(sql.SQL("ANALYZE {};").format(sql.Identifier(TABLE)))
+    conn.commit()
+
+# (versión, descripción, función) en orden de aplicación
+MIGRATIONS = [
+    (1, "candlestick_data particionada por intervalo y rango de tiempo", _migration_partitioned_table),
+]
+
+def migrate(**options):
+    """Aplica las migraciones pendientes. Devuelve las versiones aplicadas."""
+    applied_now = []
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                );
+            """)
+            cursor.execute("SELECT version FROM schema_version;")
+            applied = {row[0] for row in cursor.fetchall()}
+        conn.commit()
+        for version, description, func in MIGRATIONS:
+            if version in applied:
+                continue
+            logging.info(f"Aplicando migración {version}: {description}")
+            func(conn, **options)
+            with conn.cursor() as cursor:
+                cursor.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s);",
+                               (version, description))
+            conn.commit()
+            applied_now.append(version)
+    return applied_now
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Gestión del esquema de candlestick_data.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = commands.add_parser("migrate", help="Aplica las migraciones pendientes.")
+    migrate_parser.add_argument("--chunk-candles", type=int, default=MIGRATION_CHUNK_CANDLES,
+                                help="Velas por símbolo en cada lote de la copia.")
+    migrate_parser.add_argument("--drop-legacy", action="store_true",
+                                help="Elimina la tabla antigua al terminar la copia.")
+    partitions_parser = commands.add_parser("partitions", help="Crea las particiones de los próximos meses.")
+    partitions_parser.add_argument("--ahead-months", type=int, default=AHEAD_MONTHS)
+    return parser
+
+if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+    if args.command == "migrate":
+        versions = migrate(chunk_candles=args.chunk_candles, drop_legacy=args.drop_legacy)
+        print(f"Migraciones aplicadas: {versions}" if versions else "El esquema ya está actualizado.")
+        ensure_upcoming_partitions()
+    else:
+        ensure_upcoming_partitions(args.ahead_months)
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+from backtest import encode_signals, BUY, SELL
+from config import indicator_settings
+from indicadores import compute_indicator, indicator_series
+
+#############################
+# CONTRATO DE ESTRATEGIAS
+#############################
+#
+# Un módulo de la carpeta 'estrategias' define:
+#   - 'strategy_name' (string)
+#   - 'generate_signals(data, **params)' que recibe un mapeo de columnas a arrays
+#     (dict de arrays NumPy o DataFrame con 'open', 'high', 'low', 'close', 'volume')
+#     y devuelve una tupla (signals, indicators):
+#       * signals: array int8 con +1 (compra), -1 (venta) y 0 (sin señal)
+#       * indicators: diccionario {nombre: array} con las series a graficar
+#   - opcionalmente 'default_params' (dict) con los parámetros por defecto.
+#   - opcionalmente 'supports_matrix = True' si 'generate_signals' acepta también
+#     matrices 2D (tiempo x símbolo) y devuelve señales de la misma forma; lo usa
+#     el backtest multiactivo para procesar todos los símbolos de una vez.
+#
+# Los módulos antiguos que solo definen 'apply_strategy(data)' y devuelven el
+# DataFrame con una columna 'signals' de texto ('buy'/'sell'/'') se siguen
+# aceptando a través de un adaptador.
+
+def strategy_params(mod, **params):
+    """Combina los parámetros por defecto de la estrategia con los indicados."""
+    return {**getattr(mod, "default_params", {}), **params}
+
+def _legacy_signals(mod, data):
+    """Adaptador para estrategias que devuelven señales de texto mediante 'apply_strategy'."""
+    frame = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+    result = mod.apply_strategy(frame)
+    signals = encode_signals(result['signals'].to_numpy())
+    indicators = {col: result[col].to_numpy() for col in result.columns
+                  if col not in frame.columns and col != 'signals'
+                  and pd.api.types.is_numeric_dtype(result[col])}
+    return signals, indicators
+
+def run_strategy(mod, data, **params):
+    """
+    Ejecuta cualquier módulo de estrategia y devuelve (signals int8, indicators).
+    Usa 'generate_signals' si existe y, si no, el adaptador de 'apply_strategy'.
+    """
+    if hasattr(mod, "generate_signals"):
+        signals, indicators = mod.generate_signals(data, **strategy_params(mod, **params))
+        return encode_signals(signals), indicators
+    return _legacy_signals(mod, data)
+
+#############################
+# UTILIDADES VECTORIZADAS PARA ESTRATEGIAS
+#############################
+
+def ema(values, span):
+    """Media móvil exponencial (adjust=False) sobre un array 1D o 2D (a lo largo del eje 0)."""
+    values = np.asarray(values, dtype=np.float64)
+    return pd.DataFrame(values).ewm(span=span, adjust=False).mean().to_numpy().reshape(values.shape)
+
+def indicator(data, name, **params):
+    """
+    Devuelve el indicador 'name' ('ema', 'sma', 'rsi', 'atr') para las velas de 'data'.
+    Si 'data' es un DataFrame con data.attrs['symbol'] y data.attrs['interval'] (como los
+    de fetch_data_from_db), se usa el motor incremental con estado persistido; si no,
+    se calcula sobre la serie completa. Con matrices 2D (tiempo x símbolo) devuelve una
+    matriz de la misma forma.
+    """
+    attrs = getattr(data, "attrs", {})
+    if "symbol" in attrs and "interval" in attrs and indicator_settings()["enabled"]:
+        return indicator_series(attrs["symbol"], attrs["interval"], name, data, **params)
+    inputs = {col: np.asarray(data[col], dtype=np.float64) for col in ("close", "high", "low") if col in data}
+    if inputs["close"].ndim == 2:
+        # Matriz tiempo x símbolo: la EMA se calcula de una vez, el resto columna a columna
+        if name == "ema":
+            return ema(inputs["close"], params["span"])
+        columns = [compute_indicator(name, {col: values[:, j] for col, values in inputs.items()}, **params)
+                   for j in range(inputs["close"].shape[1])]
+        return np.column_stack(columns) if columns else np.empty(inputs["close"].shape)
+    return compute_indicator(name, inputs, **params)
+
+def crossover_signals(fast, slow):
+    """
+    Detecta cruces entre dos series mediante el cambio de signo de su diferencia.
+    +1 cuando 'fast' cruza por encima de 'slow', -1 cuando cruza por debajo.
+    La primera vela nunca tiene señal. Acepta arrays 1D o 2D (tiempo en el eje 0).
+    """
+    above = np.asarray(fast) > np.asarray(slow)
+    below = np.asarray(fast) < np.asarray(slow)
+    signals = np.zeros(above.shape, dtype=np.int8)
+    signals[1:][above[1:] & ~above[:-1]] = BUY
+    signals[1:][below[1:] & ~below[:-1]] = SELL
+    return signals
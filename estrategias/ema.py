@@ -1,25 +1,37 @@
-import pandas as pd
+from estrategia import indicator, crossover_signals
 
 # Define el nombre de la estrategia (esto aparecerá en el menú desplegable)
 strategy_name = "EMA"
 
+# Parámetros por defecto (periodos de las EMAs rápida y lenta)
+default_params = {"fast": 10, "slow": 50}
+
+# generate_signals acepta matrices tiempo x símbolo (backtest multiactivo)
+supports_matrix = True
+
+def generate_signals(data, fast=10, slow=50):
+    """
+    Aplica la estrategia de cruce de EMAs ('fast' y 'slow' periodos) sobre data['close'].
+    Devuelve (signals, indicators): señales int8 (+1 compra, -1 venta, 0 nada)
+    y las EMAs calculadas para graficar.
+    """
+    ema_fast = indicator(data, "ema", span=fast)
+    ema_slow = indicator(data, "ema", span=slow)
+    signals = crossover_signals(ema_fast, ema_slow)
+    return signals, {f"EMA{fast}": ema_fast, f"EMA{slow}": ema_slow}
+
 def apply_strategy(data):
     """
-    Aplica la estrategia de cruce de EMAs (10 y 50 periodos) al DataFrame 'data'.
-    Se calculan las EMAs y se generan señales 'buy' y 'sell'.
-    Devuelve el DataFrame modificado.
+    Compatibilidad con el contrato antiguo: devuelve una copia del DataFrame 'data'
+    con las columnas EMA10, EMA50 y 'signals' (int8).
     """
     data = data.copy()
-    data['EMA10'] = data['close'].ewm(span=10, adjust=False).mean()
-    data['EMA50'] = data['close'].ewm(span=50, adjust=False).mean()
-    
-    signals = ['']  # Sin señal para la primera vela
-    for i in range(1, len(data)):
-        if data['EMA10'].iloc[i] > data['EMA50'].iloc[i] and data['EMA10'].iloc[i-1] <= data['EMA50'].iloc[i-1]:
-            signals.append('buy')
-        elif data['EMA10'].iloc[i] < data['EMA50'].iloc[i] and data['EMA10'].iloc[i-1] >= data['EMA50'].iloc[i-1]:
-            signals.append('sell')
-        else:
-            signals.append('')
+    signals, indicators = generate_signals(data, **default_params)
+    for name, values in indicators.items():
+        data[name] = values
     data['signals'] = signals
     return data
+
+def valid_params(fast, slow):
+    """Descarta combinaciones del barrido donde la EMA rápida no es más corta que la lenta."""
+    return fast < slow
@@ -1,10 +1,32 @@
+import io
+import os
+import asyncio
+import contextlib
+import json
 import time
 import logging
+import argparse
+import heapq
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+import numpy as np
 from binance.client import Client
+from binance.helpers import date_to_milliseconds
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 from psycopg2.errors import UniqueViolation
+from db import connection, invalidate_cache
+from intervalos import INTERVAL_MS, next_close_time
+from rollups import update_rollups, rebuild_rollups, BASE_INTERVAL, ROLLUP_INTERVALS
+from ring_buffer import CandleRingBuffer
+import metricas
+from huecos import find_gaps, coverage
+from esquema import ensure_upcoming_partitions, ensure_range_partitions, start_partition_maintenance
 
 # Configuración de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -12,32 +34,40 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # Configuración de la API de Binance
 api_key = 'tu_api_key'  # Reemplaza con tu API Key
 api_secret = 'tu_api_secret'  # Reemplaza con tu API Secret
-client = Client(api_key, api_secret)
+_client = None
 
-# Conexión a la base de datos PostgreSQL
-def get_db_connection():
-    try:
-        conn = psycopg2.connect(dbname="cripto_db", user="cripto_user", password="demitrico1", host="localhost")
-        return conn
-    except Exception as e:
-        logging.error(f"Error al conectar a la base de datos: {e}")
-        raise
+def get_client():
+    """Crea el cliente de Binance la primera vez que se usa (el constructor hace una petición)."""
+    global _client
+    if _client is None:
+        _client = Client(api_key, api_secret)
+    return _client
+
+# Endpoint REST de velas (se puede apuntar a una API local de pruebas con BINANCE_API_URL)
+BINANCE_API_URL = os.environ.get("BINANCE_API_URL", "https://api.binance.com")
+PAGE_LIMIT = 1000  # Máximo de velas por petición que admite Binance
+
+# Endpoint websocket de streams combinados (configurable para pruebas con BINANCE_WS_URL)
+BINANCE_WS_URL = os.environ.get("BINANCE_WS_URL", "wss://stream.binance.com:9443")
+
+# Límite de peso de peticiones REST de Binance por minuto (se usa solo una fracción como margen)
+REQUEST_WEIGHT_PER_MINUTE = 6000
+REQUEST_WEIGHT_BUDGET = 0.8
+
+# Carpeta donde se guarda el último timestamp confirmado por (símbolo, intervalo)
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", "checkpoints")
 
 # Función para obtener el último timestamp registrado en la base de datos
+@metricas.instrument("get_last_timestamp")
 def get_last_timestamp(symbol, interval):
-    conn = None
-    cursor = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Consulta el último timestamp registrado en la base de datos para ese símbolo e intervalo
-        cursor.execute("""
-            SELECT MAX(timestamp) FROM candlestick_data
-            WHERE symbol = %s AND interval = %s;
-        """, (symbol, interval))
-
-        result = cursor.fetchone()
+        with connection() as conn, conn.cursor() as cursor:
+            # Consulta el último timestamp registrado en la base de datos para ese símbolo e intervalo
+            cursor.execute("""
+                SELECT MAX(timestamp) FROM candlestick_data
+                WHERE symbol = %s AND interval = %s;
+            """, (symbol, interval))
+            result = cursor.fetchone()
         last_timestamp = result[0] if result[0] else None
         logging.info(f"Último timestamp registrado para {symbol} con intervalo {interval}: {last_timestamp}")
 
@@ -45,13 +75,9 @@ def get_last_timestamp(symbol, interval):
     except Exception as e:
         logging.error(f"Error al obtener el último timestamp: {e}")
         return None
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 # Función para obtener los datos de Binance a partir de un timestamp específico
+@metricas.instrument("fetch_binance_data")
 def fetch_binance_data(symbol, interval, start_date, last_timestamp=None):
     try:
         if last_timestamp:
@@ -59,89 +85,558 @@ def fetch_binance_data(symbol, interval, start_date, last_timestamp=None):
             start_date = datetime.utcfromtimestamp(last_timestamp / 1000).strftime('%d %b, %Y %H:%M:%S')
 
         # Descargar los datos históricos de Binance
-        klines = client.get_historical_klines(symbol, interval, start_date)
-        print("intentando obtener datos")
+        klines = get_client().get_historical_klines(symbol, interval, start_date)
         logging.info(f"Datos obtenidos para {symbol} desde {start_date} con intervalo {interval}. Total de {len(klines)} registros.")
         return klines
     except Exception as e:
         logging.error(f"Error al obtener datos de Binance: {e}")
         raise
 
+# Columnas de candlestick_data que se escriben en cada inserción
+CANDLE_COLUMNS = (
+    "timestamp", "symbol", "interval", "open", "high", "low", "close", "volume",
+    "quote_asset_volume", "number_of_trades", "taker_buy_base_asset_volume",
+    "taker_buy_quote_asset_volume",
+)
+
+# Índices de los campos numéricos de cada kline de Binance que se guardan
+# (0 open time, 1-5 OHLCV, 7 quote volume, 8 trades, 9-10 taker volumes)
+KLINE_FIELDS = [0, 1, 2, 3, 4, 5, 7, 8, 9, 10]
+
+# Número de filas por lote en la escritura masiva
+BATCH_SIZE = 10000
+
+def parse_klines(data):
+    """
+    Convierte la lista de klines de Binance en una matriz float64 con una sola
+    conversión tipada (en lugar de un float() por campo y por fila).
+    Columnas: timestamp, open, high, low, close, volume, quote_asset_volume,
+    number_of_trades, taker_buy_base_asset_volume, taker_buy_quote_asset_volume.
+    """
+    if len(data) == 0:
+        return np.empty((0, len(KLINE_FIELDS)))
+    return np.asarray(data, dtype=object)[:, KLINE_FIELDS].astype(np.float64)
+
+def _copy_batch(cursor, batch, symbol, interval):
+    """Carga un lote con COPY en una tabla temporal y lo fusiona con ON CONFLICT DO NOTHING."""
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS candlestick_staging
+        (LIKE candlestick_data INCLUDING DEFAULTS) ON COMMIT DELETE ROWS;
+    """)
+    buffer = io.StringIO()
+    fmt = f"%d,{symbol},{interval},%s,%s,%s,%s,%s,%s,%d,%s,%s"
+    np.savetxt(buffer, batch, fmt=fmt)
+    buffer.seek(0)
+    columns = ", ".join(CANDLE_COLUMNS)
+    cursor.copy_expert(f"COPY candlestick_staging ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+    cursor.execute(f"""
+        INSERT INTO candlestick_data ({columns})
+        SELECT {columns} FROM candlestick_staging
+        ON CONFLICT (timestamp, symbol, interval) DO NOTHING;
+    """)
+    return cursor.rowcount
+
+def _values_batch(cursor, batch, symbol, interval):
+    """Inserta un lote con execute_values (alternativa cuando COPY no está disponible)."""
+    rows = [(int(r[0]), symbol, interval, r[1], r[2], r[3], r[4], r[5], r[6], int(r[7]), r[8], r[9])
+            for r in batch.tolist()]
+    inserted = execute_values(cursor, f"""
+        INSERT INTO candlestick_data ({", ".join(CANDLE_COLUMNS)})
+        VALUES %s
+        ON CONFLICT (timestamp, symbol, interval) DO NOTHING
+        RETURNING timestamp;
+    """, rows, page_size=len(rows), fetch=True)
+    return len(inserted)
+
 # Función para guardar los datos en la base de datos
-def save_to_db(data, symbol, interval):
-    conn = None
-    cursor = None
+@metricas.instrument("save_to_db")
+def save_to_db(data, symbol, interval, batch_size=BATCH_SIZE, use_copy=True):
+    """
+    Guarda las klines en candlestick_data por lotes de 'batch_size' filas.
+    Cada lote se carga con COPY en una tabla temporal y se fusiona con un único
+    INSERT ... ON CONFLICT DO NOTHING; si COPY falla se usa execute_values.
+    Devuelve (filas insertadas, filas omitidas por duplicadas).
+    """
+    inserted = 0
+    skipped = 0
+    labels = {"symbol": symbol, "interval": interval}
+    rows = parse_klines(data)
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        for entry in data:
-            timestamp = int(entry[0])
-            open_price = float(entry[1])
-            high_price = float(entry[2])
-            low_price = float(entry[3])
-            close_price = float(entry[4])
-            volume = float(entry[5])
-            quote_asset_volume = float(entry[7])
-            number_of_trades = int(entry[8])
-            taker_buy_base_asset_volume = float(entry[9])
-            taker_buy_quote_asset_volume = float(entry[10])
-
-            # Inserción de datos en la tabla candlestick_data
-            print("incertando datos en la tabla candlestick_data")
-            cursor.execute("""
-                INSERT INTO candlestick_data (
-                    timestamp, symbol, interval, open, high, low, close, volume, 
-                    quote_asset_volume, number_of_trades, taker_buy_base_asset_volume, 
-                    taker_buy_quote_asset_volume)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (timestamp, symbol, interval) DO NOTHING;
-            """, (timestamp, symbol, interval, open_price, high_price, low_price, close_price, 
-                  volume, quote_asset_volume, number_of_trades, taker_buy_base_asset_volume, 
-                  taker_buy_quote_asset_volume))
-        
-        conn.commit()
-        logging.info(f"Datos de {symbol} con intervalo {interval} insertados correctamente.")
+        # Si el bloque falla, connection() deshace la transacción pendiente
+        with connection() as conn, conn.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                if use_copy:
+                    try:
+                        batch_inserted = _copy_batch(cursor, batch, symbol, interval)
+                    except psycopg2.Error as e:
+                        logging.warning(f"COPY no disponible ({e}). Se usa execute_values.")
+                        conn.rollback()
+                        use_copy = False
+                if not use_copy:
+                    batch_inserted = _values_batch(cursor, batch, symbol, interval)
+                commit_started = time.perf_counter()
+                conn.commit()
+                metricas.observe("db_commit_seconds", time.perf_counter() - commit_started, labels=labels,
+                                 help_text="Tiempo de commit de cada lote en segundos")
+                inserted += batch_inserted
+                skipped += len(batch) - batch_inserted
+                logging.info(f"Lote de {len(batch)} filas de {symbol} ({interval}): "
+                             f"{batch_inserted} insertadas, {len(batch) - batch_inserted} duplicadas.")
+
+        logging.info(f"Datos de {symbol} con intervalo {interval} guardados: "
+                     f"{inserted} insertados, {skipped} omitidos por duplicados.")
+        metricas.inc("rows_inserted_total", inserted, labels=labels, help_text="Velas insertadas")
+        metricas.inc("rows_skipped_total", skipped, labels=labels, help_text="Velas omitidas por duplicadas")
     except UniqueViolation:
         logging.warning(f"Datos duplicados para {symbol} en el intervalo {interval}. Se omiten.")
     except Exception as e:
         logging.error(f"Error al guardar datos en la base de datos: {e}")
-        conn.rollback()  # Deshacer la transacción en caso de error
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+        raise
+    return inserted, skipped
 
-# Función principal para descargar y almacenar datos
-def main(symbol, interval, start_date, end_date=None):
+#############################
+# LÍMITE DE PETICIONES (TOKEN BUCKET)
+#############################
+
+class TokenBucket:
+    """
+    Token bucket seguro entre hilos: 'capacity' tokens como máximo, que se reponen
+    a 'refill_rate' tokens por segundo. acquire() bloquea hasta que hay tokens.
+    """
+
+    def __init__(self, capacity, refill_rate):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.refill_rate
+            time.sleep(wait)
+
+def kline_request_weight(limit):
+    """Peso que Binance asigna a una petición de velas según 'limit'."""
+    if limit <= 100:
+        return 1
+    if limit <= 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+# Presupuesto compartido por todas las descargas del proceso
+_weight_budget = REQUEST_WEIGHT_PER_MINUTE * REQUEST_WEIGHT_BUDGET
+rate_limiter = TokenBucket(_weight_budget, _weight_budget / 60)
+
+#############################
+# DESCARGA PAGINADA CON CHECKPOINTS
+#############################
+
+def _checkpoint_path(symbol, interval):
+    return os.path.join(CHECKPOINT_DIR, f"{symbol}_{interval}.json")
+
+def load_checkpoint(symbol, interval):
+    """Devuelve el timestamp de la última vela confirmada en la base de datos, o None."""
+    try:
+        with open(_checkpoint_path(symbol, interval)) as f:
+            return json.load(f)["last_timestamp"]
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError) as e:
+        logging.warning(f"Checkpoint inválido para {symbol} ({interval}): {e}. Se ignora.")
+        return None
+
+def save_checkpoint(symbol, interval, last_timestamp):
+    """Guarda el checkpoint de forma atómica (archivo temporal + reemplazo)."""
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    path = _checkpoint_path(symbol, interval)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"symbol": symbol, "interval": interval, "last_timestamp": int(last_timestamp)}, f)
+    os.replace(tmp_path, path)
+
+@metricas.instrument("fetch_klines_page")
+def fetch_klines_page(symbol, interval, start_ms, end_ms=None, limit=PAGE_LIMIT, base_url=None, retries=3):
+    """Descarga una página de velas desde el endpoint REST /api/v3/klines."""
+    rate_limiter.acquire(kline_request_weight(limit))
+    params = {"symbol": symbol, "interval": interval, "startTime": int(start_ms), "limit": limit}
+    if end_ms is not None:
+        params["endTime"] = int(end_ms)
+    url = f"{base_url or BINANCE_API_URL}/api/v3/klines?{urllib.parse.urlencode(params)}"
+    for attempt in range(retries):
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            # 429/418: límite de peticiones superado, esperar lo indicado por Binance
+            if e.code in (418, 429) and attempt < retries - 1:
+                wait = int(e.headers.get("Retry-After", 60))
+                logging.warning(f"Límite de peticiones alcanzado. Reintentando en {wait}s.")
+                time.sleep(wait)
+            else:
+                raise
+        except urllib.error.URLError as e:
+            if attempt == retries - 1:
+                raise
+            logging.warning(f"Error de red al obtener velas ({e}). Reintentando.")
+            time.sleep(2 ** attempt)
+
+def iter_kline_pages(symbol, interval, start_ms, end_ms=None, limit=PAGE_LIMIT, base_url=None):
+    """
+    Generador que recorre el histórico página a página desde 'start_ms'.
+    Solo mantiene una página en memoria, así que el consumo no depende del rango.
+    """
+    while end_ms is None or start_ms <= end_ms:
+        page = fetch_klines_page(symbol, interval, start_ms, end_ms, limit, base_url)
+        if not page:
+            break
+        yield page
+        if len(page) < limit:
+            break
+        start_ms = page[-1][0] + 1
+
+def record_lag(symbol, interval, last_timestamp):
+    """Actualiza cuánto va por detrás (segundos) la última vela guardada respecto al reloj."""
+    metricas.set_gauge("candle_lag_seconds", time.time() - last_timestamp / 1000,
+                       labels={"symbol": symbol, "interval": interval},
+                       help_text="Segundos entre la apertura de la última vela guardada y ahora")
+
+def prepare_partitions(interval, page):
+    """Crea las particiones del tramo de la página antes de guardarla."""
     try:
-        # Paso 1: Obtener el último timestamp registrado en la base de datos
-        last_timestamp = get_last_timestamp(symbol, interval)
+        ensure_range_partitions(interval, page[0][0], page[-1][0])
+    except psycopg2.Error as e:
+        # Las velas se guardan igualmente (en la partición por defecto)
+        logging.error(f"No se pudieron crear las particiones de {interval}: {e}")
+
+def stream_to_db(symbol, interval, start_date, end_date=None, base_url=None, batch_size=BATCH_SIZE):
+    """
+    Descarga las velas página a página y guarda cada una en la base de datos.
+    Tras confirmar cada página se actualiza el checkpoint, de modo que un reinicio
+    continúa desde la última página guardada.
+    Devuelve (filas insertadas, filas omitidas por duplicadas).
+    """
+    checkpoint = load_checkpoint(symbol, interval)
+    if checkpoint is None:
+        checkpoint = get_last_timestamp(symbol, interval)
+    start_ms = checkpoint + 1 if checkpoint else date_to_milliseconds(start_date)
+    end_ms = date_to_milliseconds(end_date) if end_date else None
 
-        # Paso 2: Si ya hay datos, obtener los nuevos datos a partir del último timestamp
-        data = fetch_binance_data(symbol, interval, start_date, last_timestamp)
+    inserted = 0
+    skipped = 0
+    pages = 0
+    for page in iter_kline_pages(symbol, interval, start_ms, end_ms, base_url=base_url):
+        # No guardar la vela en curso: se guardaría incompleta y el checkpoint la saltaría
+        now_ms = int(time.time() * 1000)
+        page = [kline for kline in page if kline[6] < now_ms]
+        if not page:
+            break
+        prepare_partitions(interval, page)
+        page_inserted, page_skipped = save_to_db(page, symbol, interval, batch_size=batch_size)
+        save_checkpoint(symbol, interval, page[-1][0])
+        record_lag(symbol, interval, page[-1][0])
+        inserted += page_inserted
+        skipped += page_skipped
+        pages += 1
+    logging.info(f"Descarga de {symbol} ({interval}) completada: {pages} páginas, "
+                 f"{inserted} filas insertadas, {skipped} duplicadas.")
+    return inserted, skipped
 
-        # Paso 3: Guardar los nuevos datos en la base de datos
-        save_to_db(data, symbol, interval)
+# Función principal para descargar y almacenar datos
+def main(symbol, interval, start_date, end_date=None, rollups=ROLLUP_INTERVALS):
+    try:
+        # Descargar página a página desde el último checkpoint (o el último timestamp
+        # registrado en la base de datos) y guardar cada página al recibirla
+        stream_to_db(symbol, interval, start_date, end_date)
+
+        # Los intervalos mayores se construyen a partir de las velas de 1m ya guardadas
+        if interval == BASE_INTERVAL and rollups:
+            update_rollups(symbol, rollups)
     except Exception as e:
         logging.error(f"Error en la ejecución del script: {e}")
 
-if __name__ == '__main__':
-    symbol = 'BTCUSDT'  # Par de trading
-    interval = '1h'  # Intervalo, por ejemplo, 1m, 5m, 1h, 1d
-    start_date = '1 Jan, 2017'  # Fecha de inicio
-
-    # Ejecutar el script
-    main(symbol, interval, start_date)
-    
-    # Para ejecución periódica puedes usar un ciclo con un retraso
-    # por ejemplo, ejecutar cada hora
+#############################
+# RELLENO DE HUECOS
+#############################
+
+def backfill_range(symbol, interval, start_ms, end_ms, base_url=None):
+    """Descarga y guarda las velas de [start_ms, end_ms]. Devuelve las filas insertadas."""
+    inserted = 0
+    for page in iter_kline_pages(symbol, interval, start_ms, end_ms, base_url=base_url):
+        prepare_partitions(interval, page)
+        page_inserted, _ = save_to_db(page, symbol, interval)
+        inserted += page_inserted
+    return inserted
+
+def backfill_gaps(watchlist, workers=4, start_ms=None, base_url=None, rollups=ROLLUP_INTERVALS):
+    """
+    Busca los huecos de cada (símbolo, intervalo) y los rellena en paralelo con como
+    mucho 'workers' descargas simultáneas (todas comparten 'rate_limiter').
+    Los agregados construidos sobre huecos de 1m rellenados se recalculan y las
+    entradas afectadas de la caché local se invalidan.
+    Devuelve {(símbolo, intervalo): cobertura tras el relleno}.
+    """
+    jobs = []
+    for symbol, interval in watchlist:
+        gaps = find_gaps(symbol, interval, start_ts=start_ms)
+        missing = sum((end - start) // INTERVAL_MS[interval] + 1 for start, end in gaps)
+        logging.info(f"{symbol} ({interval}): {len(gaps)} huecos, {missing} velas ausentes.")
+        jobs.extend((symbol, interval, start, end) for start, end in gaps)
+
+    repaired = {}   # (símbolo, intervalo) -> tramos con velas nuevas
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(backfill_range, *job, base_url=base_url): job for job in jobs}
+        for future, (symbol, interval, start, end) in futures.items():
+            try:
+                inserted = future.result()
+                if inserted:
+                    repaired.setdefault((symbol, interval), []).append((start, end))
+                else:
+                    # Binance tampoco tiene esas velas (p. ej. mantenimiento del exchange)
+                    logging.info(f"{symbol} ({interval}): sin datos en Binance para {start}-{end}.")
+            except Exception as e:
+                logging.error(f"Error al rellenar {symbol} ({interval}) {start}-{end}: {e}")
+
+    for (symbol, interval), ranges in repaired.items():
+        stale = [interval]
+        if interval == BASE_INTERVAL and rollups:
+            try:
+                rebuild_rollups(symbol, ranges, rollups)
+                stale += list(rollups)
+            except Exception as e:
+                logging.error(f"Error al recalcular los agregados de {symbol}: {e}")
+        # Las velas nuevas quedan por detrás de lo cacheado: la caché no las vería
+        invalidate_cache(symbol, stale)
+
+    return {(symbol, interval): coverage(symbol, interval, start_ts=start_ms) for symbol, interval in watchlist}
+
+#############################
+# MODO STREAMING (WEBSOCKET)
+#############################
+#
+# Se suscribe a los streams de velas de la watchlist. Cada (símbolo, intervalo)
+# mantiene sus últimas velas en un CandleRingBuffer; las velas cerradas se
+# acumulan y se guardan en PostgreSQL en pequeños lotes. Al (re)conectar se
+# rellenan por REST los huecos desde el último checkpoint.
+
+RING_BUFFER_SIZE = 1000      # Velas recientes en memoria por (símbolo, intervalo)
+FLUSH_SECONDS = 0.5          # Frecuencia máxima de escritura de velas cerradas
+FLUSH_SIZE = 500             # Escribir antes si se acumulan tantas velas cerradas
+
+# Últimas velas por (símbolo, intervalo), actualizadas en tiempo real
+ring_buffers = {}
+
+def kline_from_event(k):
+    """Convierte el campo 'k' de un evento websocket al formato de kline REST."""
+    return [k["t"], k["o"], k["h"], k["l"], k["c"], k["v"], k["T"], k["q"], k["n"], k["V"], k["Q"], "0"]
+
+def latest_candles(symbol, interval, n=None):
+    """Últimas 'n' velas en memoria (incluida la vela en curso) como dict de arrays."""
+    buffer = ring_buffers.get((symbol, interval))
+    return buffer.latest(n) if buffer is not None else None
+
+async def _reconcile(watchlist, start_date, rollups, ready):
+    """
+    Rellena por REST los huecos desde el último checkpoint de cada (símbolo, intervalo).
+    Mientras tanto no se escriben velas del stream, para que sus checkpoints no
+    adelanten el punto desde el que se rellena.
+    """
+    ready.clear()
+    await asyncio.gather(*(asyncio.to_thread(main, symbol, interval, start_date, rollups=rollups)
+                           for symbol, interval in watchlist))
+    ready.set()
+
+def _flush(pending, rollups):
+    """Guarda las velas cerradas pendientes agrupadas por (símbolo, intervalo)."""
+    for (symbol, interval), klines in pending.items():
+        klines.sort(key=lambda kline: kline[0])
+        save_to_db(klines, symbol, interval)
+        save_checkpoint(symbol, interval, klines[-1][0])
+        record_lag(symbol, interval, klines[-1][0])
+        if interval == BASE_INTERVAL and rollups:
+            update_rollups(symbol, rollups)
+
+async def _flush_loop(pending, lock, rollups, wake, ready):
     while True:
         try:
-            logging.info("Ejecutando descarga de datos...")
-            main(symbol, interval, start_date)  # Vuelve a descargar los datos
-            time.sleep(3600)  # Esperar una hora antes de ejecutar nuevamente
+            await asyncio.wait_for(wake.wait(), FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        wake.clear()
+        if not ready.is_set():
+            continue  # Relleno por REST en curso
+        async with lock:
+            if not pending:
+                continue
+            batch = dict(pending)
+            pending.clear()
+        try:
+            await asyncio.to_thread(_flush, batch, rollups)
         except Exception as e:
-            logging.error(f"Error en la ejecución programada: {e}")
-            time.sleep(60)  # Espera de 1 minuto antes de intentar nuevamente
+            # Se conservan para el siguiente intento; el checkpoint no avanzó
+            logging.error(f"Error al guardar velas del stream: {e}")
+            async with lock:
+                for key, klines in batch.items():
+                    pending.setdefault(key, []).extend(klines)
+
+async def run_stream(watchlist, start_date, ws_url=None, rollups=ROLLUP_INTERVALS, buffer_size=RING_BUFFER_SIZE):
+    """
+    Descarga en tiempo real por websocket las velas de 'watchlist' hasta que se cancele.
+    Tras cada desconexión se reconecta con espera creciente y se rellenan los huecos por REST.
+    """
+    import websockets  # Solo hace falta en modo --stream
+    # Particiones de los próximos meses, revisadas a diario mientras dure el proceso
+    start_partition_maintenance()
+    for key in watchlist:
+        ring_buffers.setdefault(key, CandleRingBuffer(buffer_size))
+    streams = "/".join(f"{symbol.lower()}@kline_{interval}" for symbol, interval in watchlist)
+    url = f"{ws_url or BINANCE_WS_URL}/stream?streams={streams}"
+    pending = {}
+    lock = asyncio.Lock()
+    wake = asyncio.Event()
+    ready = asyncio.Event()
+    flusher = asyncio.create_task(_flush_loop(pending, lock, rollups, wake, ready))
+    reconcile = None
+    backoff = 1
+    try:
+        while True:
+            try:
+                async with websockets.connect(url, ping_interval=20) as ws:
+                    logging.info(f"Conectado al stream de velas ({len(watchlist)} streams).")
+                    backoff = 1
+                    # Huecos desde el último checkpoint (arranque o desconexión previa).
+                    # Se detienen las escrituras del stream ya, antes de que arranque la tarea
+                    ready.clear()
+                    reconcile = asyncio.create_task(_reconcile(watchlist, start_date, rollups, ready))
+                    async for message in ws:
+                        event = json.loads(message).get("data", {})
+                        if event.get("e") != "kline":
+                            continue
+                        k = event["k"]
+                        key = (event["s"], k["i"])
+                        kline = kline_from_event(k)
+                        ring_buffers[key].upsert([float(v) for v in kline[:11]], k["x"])
+                        if k["x"]:
+                            async with lock:
+                                pending.setdefault(key, []).append(kline)
+                                if sum(len(v) for v in pending.values()) >= FLUSH_SIZE:
+                                    wake.set()
+                    await reconcile
+                    reconcile = None
+            except (websockets.ConnectionClosed, OSError) as e:
+                logging.warning(f"Stream desconectado ({e}). Reconectando en {backoff}s.")
+                if reconcile is not None:
+                    # El relleno de esta conexión termina antes de empezar el siguiente: sus
+                    # hilos no se pueden interrumpir y los dos escribirían los mismos checkpoints
+                    await reconcile
+                    reconcile = None
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+    finally:
+        flusher.cancel()
+        if reconcile is not None:
+            reconcile.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await reconcile
+        if pending:
+            await asyncio.to_thread(_flush, pending, rollups)
+
+#############################
+# PLANIFICADOR DE DESCARGAS (VARIOS SÍMBOLOS E INTERVALOS)
+#############################
+
+# Margen tras el cierre de la vela para que Binance la publique cerrada
+CLOSE_DELAY_SECONDS = 2
+
+def run_scheduler(watchlist, start_date, workers=8, close_delay=CLOSE_DELAY_SECONDS, stop_event=None,
+                  rollups=ROLLUP_INTERVALS):
+    """
+    Ejecuta la descarga de cada (símbolo, intervalo) de 'watchlist' en un pool de hilos.
+    Todas las descargas comparten el token bucket 'rate_limiter'. Cada trabajo se
+    lanza una vez al inicio y después justo tras el cierre de cada vela de su intervalo.
+    Si un trabajo sigue en curso cuando le toca de nuevo, se omite esa ejecución.
+    Tras cada descarga de 1m se actualizan los intervalos agregados de 'rollups'.
+    """
+    for symbol, interval in watchlist:
+        if interval not in INTERVAL_MS:
+            raise ValueError(f"Intervalo no soportado: {interval}")
+    stop_event = stop_event or threading.Event()
+    # Particiones de los próximos meses, revisadas a diario mientras dure el proceso
+    start_partition_maintenance(stop_event=stop_event)
+    queue = [(time.time(), symbol, interval) for symbol, interval in watchlist]
+    heapq.heapify(queue)
+    running = {}
+    logging.info(f"Planificador iniciado con {len(watchlist)} trabajos y {workers} hilos.")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while queue and not stop_event.is_set():
+            run_at, symbol, interval = queue[0]
+            wait = run_at - time.time()
+            if wait > 0:
+                stop_event.wait(wait)
+                continue
+            heapq.heappop(queue)
+            key = (symbol, interval)
+            if key in running and not running[key].done():
+                logging.warning(f"La descarga de {symbol} ({interval}) sigue en curso. Se omite esta ejecución.")
+            else:
+                running[key] = pool.submit(main, symbol, interval, start_date, rollups=rollups)
+            next_run = next_close_time(interval, int(time.time() * 1000)) / 1000 + close_delay
+            heapq.heappush(queue, (next_run, symbol, interval))
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Descarga continua de velas de Binance a PostgreSQL.")
+    parser.add_argument("--symbols", nargs="+", default=["BTCUSDT"], help="Pares de trading.")
+    parser.add_argument("--intervals", nargs="+", default=[BASE_INTERVAL],
+                        help="Intervalos a descargar de Binance, p. ej. 1m 1h.")
+    parser.add_argument("--rollups", nargs="*", default=list(ROLLUP_INTERVALS),
+                        help="Intervalos que se construyen a partir de las velas de 1m.")
+    parser.add_argument("--start-date", default="1 Jan, 2017", help="Fecha de inicio si no hay datos previos.")
+    parser.add_argument("--workers", type=int, default=8, help="Descargas simultáneas.")
+    parser.add_argument("--metrics-port", type=int, default=9108,
+                        help="Puerto local del endpoint /metrics de Prometheus (0 para desactivarlo).")
+    parser.add_argument("--metrics-json", help="Archivo donde volcar periódicamente las métricas en JSON.")
+    parser.add_argument("--metrics-interval", type=float, default=60, help="Segundos entre volcados JSON.")
+    parser.add_argument("--backfill", action="store_true",
+                        help="Buscar y rellenar huecos en las velas guardadas y terminar.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Recibir las velas en tiempo real por websocket en lugar de consultar por REST.")
+    return parser
+
+if __name__ == '__main__':
+    args = build_arg_parser().parse_args()
+    watchlist = [(symbol, interval) for symbol in args.symbols for interval in args.intervals]
+
+    # Exposición de métricas (Prometheus por HTTP local y/o volcado JSON periódico)
+    if args.metrics_port:
+        metricas.start_http_server(args.metrics_port)
+    if args.metrics_json:
+        metricas.start_json_snapshots(args.metrics_json, args.metrics_interval)
+
+    if args.backfill:
+        # Particiones de los próximos meses (si no, las velas nuevas irían a la partición por defecto)
+        try:
+            ensure_upcoming_partitions()
+        except psycopg2.Error as e:
+            logging.error(f"No se pudieron crear las particiones: {e}")
+        # Huecos desde la fecha de inicio, rellenados en paralelo
+        report = backfill_gaps(watchlist, workers=args.workers, start_ms=date_to_milliseconds(args.start_date),
+                               rollups=args.rollups)
+        for (symbol, interval), result in report.items():
+            print(f"{symbol} {interval}: {result['rows']}/{result['expected']} velas ({result['coverage']:.2%})")
+    elif args.stream:
+        # Velas en tiempo real por websocket; los huecos se rellenan por REST al conectar
+        asyncio.run(run_stream(watchlist, args.start_date, rollups=args.rollups))
+    else:
+        # Cada (símbolo, intervalo) se descarga al inicio y después tras cada cierre de vela
+        run_scheduler(watchlist, args.start_date, workers=args.workers, rollups=args.rollups)
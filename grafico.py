@@ -0,0 +1,177 @@
+import numpy as np
+import pandas as pd
+import tkinter as tk
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import mplfinance as mpf  # Para gráficos de velas japonesas
+
+#############################
+# GRÁFICO DE VELAS CON SUBMUESTREO SEGÚN EL ANCHO VISIBLE
+#############################
+#
+# En lugar de pasar todas las velas a mplfinance, se agrupan las velas visibles
+# en tantos grupos como caben en el ancho del lienzo (OHLC y volumen correctos por
+# grupo). La rueda del ratón hace zoom y arrastrar desplaza el rango visible; en
+# ambos casos se vuelve a agrupar solo el tramo visible. La figura y el lienzo de
+# Tk se crean una vez y se reutilizan entre ejecuciones.
+
+# Píxeles por vela dibujada (a menor valor, más velas por ancho de lienzo)
+PIXELS_PER_CANDLE = 3
+MIN_CANDLES = 20
+ZOOM_FACTOR = 1.25
+
+# Colores para los indicadores superpuestos (en orden)
+INDICATOR_COLORS = ["orange", "cyan", "magenta", "yellow", "white"]
+
+_style = None
+
+def get_style():
+    """Estilo oscuro de mplfinance (se crea una sola vez)."""
+    global _style
+    if _style is None:
+        mc = mpf.make_marketcolors(up='lime', down='red', inherit=True)
+        _style = mpf.make_mpf_style(base_mpf_style='nightclouds', marketcolors=mc)
+    return _style
+
+def downsample_ohlc(data, start, end, buckets, indicators=()):
+    """
+    Agrupa las filas [start, end) de 'data' en como mucho 'buckets' grupos consecutivos.
+    Por grupo: open del primero, high máximo, low mínimo, close del último y volumen
+    sumado; los indicadores toman el último valor. El índice es el timestamp de la
+    primera vela de cada grupo.
+    """
+    count = end - start
+    if count <= buckets:
+        edges = np.arange(start, end)
+    else:
+        edges = np.unique(np.linspace(start, end, buckets + 1).astype(np.int64)[:-1])
+    last = np.concatenate((edges[1:], [end])) - 1
+    offsets = edges - start
+
+    def column(name):
+        return data[name].to_numpy()[start:end]
+
+    frame = pd.DataFrame({
+        "open": data["open"].to_numpy()[edges],
+        "high": np.maximum.reduceat(column("high"), offsets),
+        "low": np.minimum.reduceat(column("low"), offsets),
+        "close": data["close"].to_numpy()[last],
+        "volume": np.add.reduceat(column("volume"), offsets),
+    }, index=pd.DatetimeIndex(data["timestamp"].to_numpy()[edges]))
+    for name in indicators:
+        frame[name] = data[name].to_numpy()[last]
+    return frame
+
+class CandleChart:
+    """Gráfico de velas reutilizable dentro de un frame de Tk."""
+
+    def __init__(self, parent_frame):
+        self.parent_frame = parent_frame
+        self.fig = mpf.figure(style=get_style())
+        self.canvas = FigureCanvasTkAgg(self.fig, master=parent_frame)
+        widget = self.canvas.get_tk_widget()
+        widget.pack(fill=tk.BOTH, expand=True)
+        widget.bind("<Configure>", self.on_resize, add="+")
+        self.canvas.mpl_connect("scroll_event", self.on_scroll)
+        self.canvas.mpl_connect("button_press_event", self.on_press)
+        self.canvas.mpl_connect("motion_notify_event", self.on_motion)
+        self.canvas.mpl_connect("button_release_event", self.on_release)
+        self.data = None
+        self.indicators = []
+        self.show_volume = False
+        self.view = (0, 0)       # Rango visible [inicio, fin) en filas de 'data'
+        self.buckets = 0         # Velas dibujadas en el último render
+        self.drag_start = None
+        self.axes = None
+        self.width = 0           # Ancho (px) usado en el último render
+
+    def set_data(self, data, show_volume, indicators=()):
+        """Muestra un DataFrame nuevo con todas sus velas visibles."""
+        self.data = data.reset_index(drop=True)
+        self.indicators = [name for name in indicators if name in data.columns]
+        if show_volume != self.show_volume or self.axes is None:
+            self.show_volume = show_volume
+            self._create_axes()
+        self.view = (0, len(self.data))
+        self.render()
+
+    def _create_axes(self):
+        self.fig.clf()
+        if self.show_volume:
+            price_ax = self.fig.add_axes([0.08, 0.30, 0.88, 0.65])
+            volume_ax = self.fig.add_axes([0.08, 0.08, 0.88, 0.20], sharex=price_ax)
+            self.axes = (price_ax, volume_ax)
+        else:
+            self.axes = (self.fig.add_axes([0.08, 0.08, 0.88, 0.87]), None)
+
+    def render(self):
+        """Agrupa el rango visible según el ancho del lienzo y redibuja la figura."""
+        if self.data is None or len(self.data) == 0:
+            return
+        width = self._canvas_width()
+        self.width = width
+        buckets = max(width // PIXELS_PER_CANDLE, MIN_CANDLES)
+        start, end = self.view
+        frame = downsample_ohlc(self.data, start, end, buckets, self.indicators)
+        self.buckets = len(frame)
+
+        price_ax, volume_ax = self.axes
+        price_ax.clear()
+        if volume_ax is not None:
+            volume_ax.clear()
+        add_plots = [
+            mpf.make_addplot(frame[name], ax=price_ax, color=INDICATOR_COLORS[i % len(INDICATOR_COLORS)])
+            for i, name in enumerate(self.indicators)
+        ]
+        mpf.plot(frame, type='candle', ax=price_ax, volume=volume_ax if volume_ax is not None else False,
+                 addplot=add_plots)
+        self.canvas.draw_idle()
+
+    def _canvas_width(self):
+        """Ancho del lienzo en píxeles; si Tk aún no lo ha dispuesto, el de la figura."""
+        widget = self.canvas.get_tk_widget()
+        widget.update_idletasks()
+        width = widget.winfo_width()
+        if width <= 1:
+            width = int(self.fig.get_figwidth() * self.fig.dpi)
+        return max(width, 1)
+
+    def on_resize(self, event):
+        # Reagrupar solo si cambia el número de velas que caben
+        if self.data is not None and event.width // PIXELS_PER_CANDLE != self.width // PIXELS_PER_CANDLE:
+            self.render()
+
+    def _row_at(self, xdata):
+        """Convierte una posición x del gráfico (vela dibujada) en una fila de 'data'."""
+        start, end = self.view
+        return start + (xdata / max(self.buckets, 1)) * (end - start)
+
+    def on_scroll(self, event):
+        if self.data is None or event.xdata is None:
+            return
+        start, end = self.view
+        center = self._row_at(event.xdata)
+        factor = 1 / ZOOM_FACTOR if event.button == "up" else ZOOM_FACTOR
+        span = min(max((end - start) * factor, MIN_CANDLES), len(self.data))
+        new_start = int(round(center - (center - start) * span / (end - start)))
+        new_start = min(max(new_start, 0), len(self.data) - int(span))
+        self.view = (new_start, new_start + int(span))
+        self.render()
+
+    def on_press(self, event):
+        if event.button == 1 and event.inaxes is not None:
+            self.drag_start = (event.x, self.view)
+
+    def on_motion(self, event):
+        if self.drag_start is None:
+            return
+        # Se usan píxeles de pantalla porque las coordenadas x cambian con cada redibujado
+        x0, (start, end) = self.drag_start
+        axes_width = max(self.axes[0].bbox.width, 1)
+        shift = int(round((x0 - event.x) / axes_width * (end - start)))
+        shift = min(max(shift, -start), len(self.data) - end)
+        if (start + shift, end + shift) != self.view:
+            self.view = (start + shift, end + shift)
+            self.render()
+
+    def on_release(self, event):
+        self.drag_start = None
@@ -0,0 +1,78 @@
+import logging
+from db import connection
+from intervalos import INTERVAL_MS
+
+#############################
+# DETECCIÓN DE HUECOS EN candlestick_data
+#############################
+#
+# Los huecos se calculan en PostgreSQL con una función de ventana (LEAD) sobre el
+# índice (symbol, interval, timestamp): solo vuelven a Python los rangos que faltan,
+# nunca las filas, así que funciona igual con millones de velas.
+
+_GAPS_SQL = """
+    SELECT gap_start, gap_end
+    FROM (
+        SELECT timestamp + %(step)s AS gap_start,
+               LEAD(timestamp) OVER (ORDER BY timestamp) - %(step)s AS gap_end
+        FROM candlestick_data
+        WHERE symbol = %(symbol)s AND interval = %(interval)s
+          AND timestamp >= %(start)s AND timestamp <= %(end)s
+    ) AS steps
+    WHERE gap_end >= gap_start
+    ORDER BY gap_start;
+"""
+
+_COVERAGE_SQL = """
+    SELECT COUNT(*), MIN(timestamp), MAX(timestamp)
+    FROM candlestick_data
+    WHERE symbol = %(symbol)s AND interval = %(interval)s
+      AND timestamp >= %(start)s AND timestamp <= %(end)s;
+"""
+
+# Límites por defecto: todo el histórico
+MIN_TS = 0
+MAX_TS = 2 ** 62
+
+def find_gaps(symbol, interval, start_ts=None, end_ts=None):
+    """
+    Devuelve la lista de rangos de velas ausentes [(inicio, fin)] (timestamps de apertura,
+    ambos incluidos) entre la primera y la última vela guardadas dentro de [start_ts, end_ts].
+    Si se indica start_ts y las velas empiezan después, el tramo inicial también se incluye.
+    """
+    step = INTERVAL_MS[interval]
+    params = {"symbol": symbol, "interval": interval, "step": step,
+              "start": MIN_TS if start_ts is None else start_ts,
+              "end": MAX_TS if end_ts is None else end_ts}
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute(_GAPS_SQL, params)
+        gaps = [(int(start), int(end)) for start, end in cursor.fetchall()]
+        if start_ts is not None:
+            cursor.execute(_COVERAGE_SQL, params)
+            _, first, _ = cursor.fetchone()
+            if first is None:
+                return [(start_ts, end_ts)] if end_ts is not None else []
+            if first > start_ts:
+                gaps.insert(0, (start_ts, int(first) - step))
+    return gaps
+
+def coverage(symbol, interval, start_ts=None, end_ts=None):
+    """
+    Resumen de cobertura: velas guardadas, velas esperadas entre la primera y la última
+    (o entre start_ts y end_ts si se indican) y la fracción cubierta.
+    """
+    step = INTERVAL_MS[interval]
+    params = {"symbol": symbol, "interval": interval,
+              "start": MIN_TS if start_ts is None else start_ts,
+              "end": MAX_TS if end_ts is None else end_ts}
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute(_COVERAGE_SQL, params)
+        count, first, last = cursor.fetchone()
+    if not count:
+        return {"rows": 0, "expected": 0, "coverage": 0.0, "first": None, "last": None}
+    lo = first if start_ts is None else min(first, start_ts)
+    hi = last if end_ts is None else max(last, end_ts)
+    expected = (hi - lo) // step + 1
+    result = {"rows": count, "expected": expected, "coverage": count / expected, "first": first, "last": last}
+    logging.info(f"Cobertura de {symbol} ({interval}): {count}/{expected} velas ({result['coverage']:.2%}).")
+    return result
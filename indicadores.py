@@ -0,0 +1,223 @@
+import os
+import json
+import math
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from config import indicator_settings
+from intervalos import INTERVAL_MS
+
+#############################
+# INDICADORES: CÁLCULO COMPLETO (VECTORIZADO) Y PASO INCREMENTAL O(1)
+#############################
+#
+# Cada indicador define:
+#   - full(inputs, **params) -> (values, state): cálculo sobre la serie completa
+#   - step(state, row, **params) -> value: actualiza 'state' con una vela nueva
+# 'inputs' es un dict de arrays ('close', 'high', 'low') y 'row' un dict de floats.
+# El estado es JSON serializable para poder persistirlo entre reinicios.
+
+def _ema_full(inputs, span):
+    values = pd.Series(inputs["close"]).ewm(span=span, adjust=False).mean().to_numpy()
+    return values, {"value": float(values[-1])}
+
+def _ema_step(state, row, span):
+    alpha = 2 / (span + 1)
+    state["value"] = row["close"] if state["value"] is None else alpha * row["close"] + (1 - alpha) * state["value"]
+    return state["value"]
+
+def _sma_full(inputs, period):
+    close = np.asarray(inputs["close"], dtype=np.float64)
+    values = pd.Series(close).rolling(period).mean().to_numpy()
+    return values, {"window": close[-period:].tolist()}
+
+def _sma_step(state, row, period):
+    window = state["window"]
+    window.append(row["close"])
+    if len(window) > period:
+        window.pop(0)
+    return sum(window) / period if len(window) == period else math.nan
+
+def _rsi_from_averages(avg_gain, avg_loss):
+    if avg_loss == 0:
+        return 100.0 if avg_gain > 0 else 50.0
+    return 100 - 100 / (1 + avg_gain / avg_loss)
+
+def _rsi_full(inputs, period):
+    close = pd.Series(np.asarray(inputs["close"], dtype=np.float64))
+    delta = close.diff()
+    avg_gain = delta.clip(lower=0).ewm(alpha=1 / period, adjust=False).mean()
+    avg_loss = (-delta.clip(upper=0)).ewm(alpha=1 / period, adjust=False).mean()
+    gain, loss = avg_gain.to_numpy(), avg_loss.to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = np.where(loss == 0, np.where(gain > 0, 100.0, 50.0), 100 - 100 / (1 + gain / loss))
+    values[0] = math.nan
+    state = {"prev_close": float(close.iloc[-1]),
+             "avg_gain": None if len(close) < 2 else float(avg_gain.iloc[-1]),
+             "avg_loss": None if len(close) < 2 else float(avg_loss.iloc[-1])}
+    return values, state
+
+def _rsi_step(state, row, period):
+    prev_close = state["prev_close"]
+    state["prev_close"] = row["close"]
+    if prev_close is None:
+        return math.nan
+    delta = row["close"] - prev_close
+    gain, loss = max(delta, 0.0), max(-delta, 0.0)
+    if state["avg_gain"] is None:
+        state["avg_gain"], state["avg_loss"] = gain, loss
+    else:
+        state["avg_gain"] += (gain - state["avg_gain"]) / period
+        state["avg_loss"] += (loss - state["avg_loss"]) / period
+    return _rsi_from_averages(state["avg_gain"], state["avg_loss"])
+
+def _atr_full(inputs, period):
+    high = np.asarray(inputs["high"], dtype=np.float64)
+    low = np.asarray(inputs["low"], dtype=np.float64)
+    close = np.asarray(inputs["close"], dtype=np.float64)
+    prev_close = np.concatenate(([close[0]], close[:-1]))
+    true_range = np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+    values = pd.Series(true_range).ewm(alpha=1 / period, adjust=False).mean().to_numpy()
+    return values, {"prev_close": float(close[-1]), "value": float(values[-1])}
+
+def _atr_step(state, row, period):
+    prev_close = row["close"] if state["prev_close"] is None else state["prev_close"]
+    true_range = max(row["high"] - row["low"], abs(row["high"] - prev_close), abs(row["low"] - prev_close))
+    state["value"] = true_range if state["value"] is None else state["value"] + (true_range - state["value"]) / period
+    state["prev_close"] = row["close"]
+    return state["value"]
+
+INDICATORS = {
+    "ema": (_ema_full, _ema_step),
+    "sma": (_sma_full, _sma_step),
+    "rsi": (_rsi_full, _rsi_step),
+    "atr": (_atr_full, _atr_step),
+}
+
+def compute_indicator(name, inputs, **params):
+    """Calcula el indicador sobre la serie completa, sin estado persistido."""
+    full, _ = INDICATORS[name]
+    if len(inputs["close"]) == 0:
+        return np.empty(0)
+    values, _ = full(inputs, **params)
+    return values
+
+#############################
+# MOTOR INCREMENTAL CON ESTADO PERSISTIDO
+#############################
+#
+# Por (símbolo, intervalo, indicador, parámetros) se guardan en disco los
+# timestamps y valores ya calculados y el estado del último paso. Al pedir la
+# serie de nuevo solo se calculan las velas posteriores a la última guardada.
+
+_engine_lock = threading.Lock()
+
+def _state_dir(store_dir, symbol, interval, name, params):
+    suffix = "_".join(f"{key}{params[key]}" for key in sorted(params))
+    return os.path.join(store_dir, f"{symbol}_{interval}", f"{name}_{suffix}" if suffix else name)
+
+def _load_series(path):
+    try:
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None, None, None
+    rows = meta["rows"]
+    timestamps = np.fromfile(os.path.join(path, "timestamp.bin"), dtype=np.int64, count=rows)
+    values = np.fromfile(os.path.join(path, "values.bin"), dtype=np.float64, count=rows)
+    if len(timestamps) != rows or len(values) != rows:
+        return None, None, None
+    return meta, timestamps, values
+
+def _save_series(path, meta, timestamps, values, append_from=0):
+    """Guarda (o añade desde 'append_from') las series y después el meta.json de forma atómica."""
+    os.makedirs(path, exist_ok=True)
+    for file_name, array in (("timestamp.bin", timestamps), ("values.bin", values)):
+        with open(os.path.join(path, file_name), "ab" if append_from else "wb") as f:
+            f.truncate(append_from * array.itemsize)
+            f.write(np.ascontiguousarray(array[append_from:]).tobytes())
+    meta["rows"] = len(timestamps)
+    tmp_path = os.path.join(path, "meta.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(path, "meta.json"))
+
+def _timestamps_ms(data):
+    timestamps = np.asarray(data["timestamp"])
+    if np.issubdtype(timestamps.dtype, np.datetime64):
+        return timestamps.astype("datetime64[ms]").astype(np.int64)
+    return timestamps.astype(np.int64)
+
+def _tail_inputs(inputs):
+    """Valores de entrada de la última vela, para detectar si se reescribió después."""
+    return {col: float(values[-1]) for col, values in inputs.items()}
+
+def _continues(meta, stored_ts, timestamps, inputs, interval):
+    """
+    Indica si las velas pedidas continúan exactamente la serie guardada: incluyen la
+    última vela guardada sin cambios (una vela agregada abierta se reescribe) y la
+    primera vela nueva, si la hay, es la inmediatamente posterior. Si no, hay que
+    recalcular desde cero en lugar de aplicar el paso incremental sobre un hueco.
+    """
+    tail = np.flatnonzero(timestamps == stored_ts[-1])
+    if len(tail) == 0:
+        return False
+    if meta.get("tail") != {col: float(values[tail[0]]) for col, values in inputs.items()}:
+        return False
+    after = np.flatnonzero(timestamps > stored_ts[-1])
+    return len(after) == 0 or (interval in INTERVAL_MS and timestamps[after[0]] == stored_ts[-1] + INTERVAL_MS[interval])
+
+def indicator_series(symbol, interval, name, data, store_dir=None, **params):
+    """
+    Devuelve el indicador 'name' alineado con las velas de 'data' (DataFrame o dict de
+    arrays con 'timestamp' y las columnas que use el indicador).
+    Si ya hay estado guardado para estos parámetros y la petición empieza en la misma
+    vela, solo se procesan con el paso O(1) las velas posteriores a la última guardada.
+    Las ventanas con otro inicio se calculan completas en memoria sin tocar el estado
+    guardado, de modo que el resultado no depende de las peticiones anteriores.
+    """
+    store_dir = store_dir or indicator_settings()["dir"]
+    full, step = INDICATORS[name]
+    timestamps = _timestamps_ms(data)
+    if len(timestamps) == 0:
+        return np.empty(0)
+    inputs = {col: np.asarray(data[col], dtype=np.float64) for col in ("close", "high", "low") if col in data}
+    path = _state_dir(store_dir, symbol, interval, name, params)
+
+    with _engine_lock:
+        meta, stored_ts, stored_values = _load_series(path)
+        compatible = meta is not None and meta["params"] == params and len(stored_ts)
+        # Los indicadores recursivos (EMA...) dependen de la primera vela: la serie guardada
+        # solo sirve para peticiones que empiezan en la misma vela. Las ventanas históricas
+        # (otro inicio o que terminan antes de la última vela guardada) no la reemplazan
+        if compatible and (stored_ts[0] != timestamps[0] or timestamps[-1] < stored_ts[-1]):
+            values, _ = full(inputs, **params)
+            return values
+        if compatible and _continues(meta, stored_ts, timestamps, inputs, interval):
+            old = timestamps <= stored_ts[-1]
+            idx = np.searchsorted(stored_ts, timestamps[old])
+            idx = np.minimum(idx, len(stored_ts) - 1)
+            if np.array_equal(stored_ts[idx], timestamps[old]):
+                new_rows = np.flatnonzero(~old)
+                new_values = np.empty(len(new_rows))
+                state = meta["state"]
+                for i, row_idx in enumerate(new_rows):
+                    row = {col: float(values[row_idx]) for col, values in inputs.items()}
+                    new_values[i] = step(state, row, **params)
+                if len(new_rows):
+                    rows = len(stored_ts)
+                    stored_ts = np.concatenate((stored_ts, timestamps[new_rows]))
+                    stored_values = np.concatenate((stored_values, new_values))
+                    meta["state"] = state
+                    meta["tail"] = _tail_inputs(inputs)
+                    _save_series(path, meta, stored_ts, stored_values, append_from=rows)
+                return np.concatenate((stored_values[idx], new_values))
+            logging.info(f"Indicador {name} {params} de {symbol} ({interval}): velas no alineadas, se recalcula.")
+
+        # Cálculo completo: sin estado previo, parámetros distintos o historial reescrito
+        # desde la misma vela inicial; el resultado pasa a ser la serie guardada
+        values, state = full(inputs, **params)
+        _save_series(path, {"params": params, "state": state, "tail": _tail_inputs(inputs)},
+                     timestamps, np.asarray(values, dtype=np.float64))
+        return values
@@ -1,191 +1,189 @@
-import os
-import importlib.util
+import sys
+import time
+import queue
+import threading
 import logging
-import pandas as pd
-from datetime import datetime
-import psycopg2
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 from tkinter import ttk
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import mplfinance as mpf  # Para gráficos de velas japonesas
+from backtest import run_backtest, buy_and_hold_backtest, MODE_NEXT_CANDLE, MODE_POSITION
+from cargador import StrategyCatalog, load_strategies
+
+# pandas, matplotlib y mplfinance (módulos 'db', 'estrategia' y 'grafico') se importan
+# en el primer uso para que la ventana se abra sin esperarlos.
 
 # Configuración de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-#############################
-# CONEXIÓN A LA BASE DE DATOS
-#############################
-
-def get_db_connection():
-    try:
-        conn = psycopg2.connect(dbname="cripto_db", user="cripto_user", password="demitrico1", host="localhost")
-        return conn
-    except Exception as e:
-        logging.error(f"Error al conectar a la base de datos: {e}")
-        raise
-
 #############################
 # UTILIDADES: Conversión y Formateo
 #############################
 
-def date_to_timestamp(date_str):
-    """Convierte una fecha (YYYY-MM-DD) a timestamp en milisegundos."""
-    date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-    timestamp = int(date_obj.timestamp() * 1000)
-    return timestamp
-
 def format_money(amount):
     """Formatea un monto sin decimales y con el símbolo $."""
     return f"${amount:,.0f}"
 
-#############################
-# OBTENCIÓN DE DATOS DE LA BASE DE DATOS
-#############################
+def format_stats(stats):
+    """Formatea las estadísticas de un backtest en una línea."""
+    return (f"{format_money(stats['profit'])} ({stats['total_return']:.2%}) | "
+            f"Máx. Drawdown: {stats['max_drawdown']:.2%} | "
+            f"Operaciones: {stats['trades']} | Aciertos: {stats['win_rate']:.2%}")
 
-def fetch_data_from_db(symbol, interval, start_date, end_date):
-    conn = None
-    cursor = None
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        start_ts = date_to_timestamp(start_date)
-        end_ts = date_to_timestamp(end_date)
-        query = """
-            SELECT timestamp, open, high, low, close, volume
-            FROM candlestick_data
-            WHERE symbol = %s AND interval = %s AND timestamp >= %s AND timestamp <= %s
-            ORDER BY timestamp;
-        """
-        cursor.execute(query, (symbol, interval, start_ts, end_ts))
-        result = cursor.fetchall()
-        data = pd.DataFrame(result, columns=["timestamp", "open", "high", "low", "close", "volume"])
-        # Convertir a datetime
-        data['timestamp'] = pd.to_datetime(data['timestamp'], unit='ms')
-        return data
-    except Exception as e:
-        logging.error(f"Error al obtener datos de la base de datos: {e}")
-        return None
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+# Modos de backtest disponibles en la interfaz
+BACKTEST_MODES = {
+    "Vela siguiente": MODE_NEXT_CANDLE,
+    "Mantener posición": MODE_POSITION,
+}
 
 #############################
 # FUNCIONES PARA GRAFICAR
 #############################
 
-def plot_candlestick(data, parent_frame, show_volume):
-    """
-    Crea un gráfico de velas japonesas con mplfinance.
-    Si show_volume es True, se muestra el gráfico de volumen.
-    Se sobreponen los indicadores (si existen columnas EMA10 y EMA50).
-    """
-    # Convertir el DataFrame al formato que usa mplfinance:
-    data = data.set_index("timestamp")
-    
-    # Definir el estilo oscuro para mplfinance
-    mc = mpf.make_marketcolors(up='lime', down='red', inherit=True)
-    s = mpf.make_mpf_style(base_mpf_style='nightclouds', marketcolors=mc)
-    
-    add_plots = []
-    if "EMA10" in data.columns and "EMA50" in data.columns:
-        add_plots = [
-            mpf.make_addplot(data["EMA10"], color="orange"),
-            mpf.make_addplot(data["EMA50"], color="cyan")
-        ]
-    
-    # Crear la figura de mplfinance
-    fig, axlist = mpf.plot(data,
-                           type='candle',
-                           volume=show_volume,
-                           addplot=add_plots,
-                           style=s,
-                           returnfig=True)
-    
-    # Integrar la figura en Tkinter
-    for widget in parent_frame.winfo_children():
-        widget.destroy()
-    canvas = FigureCanvasTkAgg(fig, master=parent_frame)
-    canvas.draw()
-    canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-
-#############################
-# DINÁMICA DE ESTRATEGIAS
-#############################
+# Gráfico reutilizable (se crea en el primer render)
+chart = None
 
-def load_strategies():
+def plot_candlestick(data, parent_frame, show_volume, indicators=()):
     """
-    Escanea la carpeta 'estrategias' y carga los módulos de estrategia.
-    Se espera que cada módulo tenga:
-      - Una variable 'strategy_name' (string)
-      - Una función 'apply_strategy(data)' que devuelve el DataFrame modificado.
-    Retorna un diccionario {strategy_name: module}.
+    Muestra un gráfico de velas japonesas con mplfinance en 'parent_frame'.
+    Si show_volume es True, se muestra el gráfico de volumen.
+    Se sobreponen los indicadores indicados (nombres de columnas de 'data').
+    La figura y el lienzo se reutilizan entre ejecuciones y las velas se agrupan
+    según el ancho visible (ver grafico.CandleChart).
     """
-    strategies = {}
-    folder = "estrategias"
-    if not os.path.isdir(folder):
-        logging.error(f"No se encontró la carpeta '{folder}'.")
-        return strategies
-    for file in os.listdir(folder):
-        if file.endswith(".py") and file != "__init__.py":
-            module_name = file[:-3]
-            path = os.path.join(folder, file)
-            spec = importlib.util.spec_from_file_location(module_name, path)
-            mod = importlib.util.module_from_spec(spec)
-            try:
-                spec.loader.exec_module(mod)
-                if hasattr(mod, "strategy_name") and hasattr(mod, "apply_strategy"):
-                    strategies[mod.strategy_name] = mod
-                    logging.info(f"Estrategia cargada: {mod.strategy_name}")
-                else:
-                    logging.warning(f"El módulo {module_name} no define 'strategy_name' o 'apply_strategy'.")
-            except Exception as e:
-                logging.error(f"Error al cargar {module_name}: {e}")
-    return strategies
+    global chart
+    if chart is None or chart.parent_frame is not parent_frame:
+        from grafico import CandleChart
+        chart = CandleChart(parent_frame)
+    chart.set_data(data, show_volume, indicators)
 
 #############################
 # SIMULACIÓN: CALCULO DEL RENDIMIENTO
 #############################
 
-def calculate_profit(data, initial_capital, percent_per_trade):
+def calculate_profit(data, initial_capital, percent_per_trade, mode=MODE_NEXT_CANDLE):
     """
-    Simula operaciones muy básicas basadas en las señales.
+    Simula operaciones basadas en las señales con el motor vectorizado de 'backtest'.
     Cada operación invierte 'percent_per_trade' % del capital.
+    Devuelve las estadísticas del backtest (profit, total_return, max_drawdown, trades, win_rate).
     """
-    capital = initial_capital
-    trade_value = initial_capital * percent_per_trade / 100
-    for i in range(1, len(data)):
-        signal = data['signals'].iloc[i]
-        price = data['close'].iloc[i]
-        if signal == 'buy' and i+1 < len(data):
-            sell_price = data['close'].iloc[i+1]
-            profit = (sell_price - price) * (trade_value / price)
-            capital += profit
-        elif signal == 'sell' and i+1 < len(data):
-            buy_price = data['close'].iloc[i+1]
-            loss = (price - buy_price) * (trade_value / price)
-            capital -= loss
-    return capital - initial_capital
+    result = run_backtest(data['close'].to_numpy(), data['signals'].to_numpy(),
+                          initial_capital, percent_per_trade, mode=mode)
+    return result["stats"]
 
 def buy_and_hold(data, initial_capital):
-    """Calcula el rendimiento Buy & Hold."""
-    if len(data) == 0:
-        return 0
-    initial_price = data['close'].iloc[0]
-    final_price = data['close'].iloc[-1]
-    return (final_price - initial_price) * initial_capital / initial_price
+    """Calcula el rendimiento Buy & Hold con las mismas estadísticas que calculate_profit."""
+    return buy_and_hold_backtest(data['close'].to_numpy(), initial_capital)["stats"]
 
 #############################
 # INTERFAZ GRÁFICA (MODO OSCURO)
 #############################
 
+#############################
+# EJECUCIÓN EN SEGUNDO PLANO
+#############################
+#
+# La carga de datos, la estrategia y el backtest se ejecutan en un hilo del
+# executor. El hilo envía mensajes (id de ejecución, tipo, contenido) a una cola
+# que el hilo de Tk revisa periódicamente con root.after(). El gráfico se dibuja
+# siempre en el hilo de Tk. Una ejecución nueva cancela la que esté en curso.
+
+executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="estrategia")
+results_queue = queue.Queue()
+POLL_MS = 50
+
+# Ejecución activa: id (para descartar mensajes de ejecuciones anteriores) y evento de cancelación
+current_run = {"id": 0, "cancel": threading.Event()}
+# Hilo del executor que atiende cada ejecución, para interrumpir su consulta a la base de datos
+run_threads = {}
+run_threads_lock = threading.Lock()
+
+class RunCancelled(Exception):
+    """Se lanza en el hilo de trabajo cuando la ejecución se cancela o se reemplaza."""
+
+def run_pipeline(run_id, cancel, params):
+    """Ejecuta las etapas en el hilo de trabajo y publica el progreso en 'results_queue'."""
+    from db import fetch_data_from_db
+    from estrategia import run_strategy
+    timings = []
+
+    def stage(name, func, *args):
+        if cancel.is_set():
+            raise RunCancelled()
+        results_queue.put((run_id, "progress", (name, timings)))
+        started = time.perf_counter()
+        result = func(*args)
+        if cancel.is_set():
+            # p. ej. la consulta se interrumpió con cancel_queries
+            raise RunCancelled()
+        timings.append((name, time.perf_counter() - started))
+        return result
+
+    with run_threads_lock:
+        run_threads[run_id] = threading.get_ident()
+    try:
+        try:
+            # Se importa aquí la primera vez (o se recarga si el archivo cambió), fuera del hilo de Tk
+            strategy_mod = stage("Carga", strategies_dict.__getitem__, params["strategy_name"])
+        except RunCancelled:
+            raise
+        except Exception as e:
+            results_queue.put((run_id, "error", f"Error al cargar la estrategia: {e}"))
+            return
+        data = stage("Datos", fetch_data_from_db, params["symbol"], params["interval"],
+                     params["start_date"], params["end_date"])
+        if data is None or data.empty:
+            results_queue.put((run_id, "error", "Error: No se obtuvieron datos para el periodo especificado."))
+            return
+        try:
+            signals, indicators = stage("Estrategia", run_strategy, strategy_mod, data)
+        except RunCancelled:
+            raise
+        except Exception as e:
+            results_queue.put((run_id, "error", f"Error al aplicar la estrategia: {e}"))
+            return
+        data = data.assign(signals=signals, **indicators)
+        stats_strategy, stats_buy_hold = stage("Backtest", lambda: (
+            calculate_profit(data, params["initial_capital"], params["percent_per_trade"], params["mode"]),
+            buy_and_hold(data, params["initial_capital"])))
+        if cancel.is_set():
+            raise RunCancelled()
+        results_queue.put((run_id, "done", {
+            "data": data,
+            "indicators": list(indicators),
+            "stats_strategy": stats_strategy,
+            "stats_buy_hold": stats_buy_hold,
+            "timings": timings,
+        }))
+    except RunCancelled:
+        results_queue.put((run_id, "cancelled", timings))
+    except Exception as e:
+        if cancel.is_set():
+            results_queue.put((run_id, "cancelled", timings))
+        else:
+            logging.error(f"Error en la ejecución de la estrategia: {e}")
+            results_queue.put((run_id, "error", f"Error: {e}"))
+    finally:
+        with run_threads_lock:
+            run_threads.pop(run_id, None)
+
+def stop_current_run():
+    """
+    Marca la ejecución en curso como cancelada e interrumpe la consulta que esté
+    haciendo, para que no retenga la caché ni una conexión mientras empieza la nueva.
+    """
+    current_run["cancel"].set()
+    db = sys.modules.get("db")  # Si aún no se importó, no hay consultas en curso
+    with run_threads_lock:
+        thread_id = run_threads.get(current_run["id"])
+        if thread_id is not None and db is not None:
+            db.cancel_queries(thread_id)
+
+def format_timings(timings):
+    """Formatea los tiempos por etapa, p. ej. 'Datos: 0.42s | Estrategia: 0.05s'."""
+    return " | ".join(f"{name}: {seconds:.2f}s" for name, seconds in timings)
+
 def execute_strategy():
-    # Leer parámetros de la interfaz
-    symbol = symbol_var.get()
-    interval = interval_var.get()
-    start_date = start_date_var.get()
-    end_date = end_date_var.get()
+    # Leer parámetros de la interfaz (siempre en el hilo de Tk)
     selected_strategy = strategy_var.get()
     try:
         initial_capital = float(capital_var.get())
@@ -193,41 +191,77 @@ def execute_strategy():
     except ValueError:
         result_var.set("Error: Capital y porcentaje deben ser numéricos.")
         return
-    show_volume = volume_var.get()
-    
-    data = fetch_data_from_db(symbol, interval, start_date, end_date)
-    if data is None or data.empty:
-        result_var.set("Error: No se obtuvieron datos para el periodo especificado.")
-        return
-
-    # Cargar la estrategia seleccionada desde la carpeta 'estrategias'
-    if selected_strategy in strategies_dict:
-        strategy_mod = strategies_dict[selected_strategy]
-        try:
-            data = strategy_mod.apply_strategy(data)
-        except Exception as e:
-            result_var.set(f"Error al aplicar la estrategia: {e}")
-            return
-    else:
+    if selected_strategy not in strategies_dict:
         result_var.set("Error: Estrategia no encontrada.")
         return
-
-    # Calcular rendimientos
-    profit_strategy = calculate_profit(data, initial_capital, percent_per_trade)
-    profit_buy_hold = buy_and_hold(data, initial_capital)
-    
+    params = {
+        "symbol": symbol_var.get(),
+        "interval": interval_var.get(),
+        "start_date": start_date_var.get(),
+        "end_date": end_date_var.get(),
+        "strategy_name": selected_strategy,
+        "initial_capital": initial_capital,
+        "percent_per_trade": percent_per_trade,
+        "mode": BACKTEST_MODES.get(mode_var.get(), MODE_NEXT_CANDLE),
+        "mode_label": mode_var.get(),
+        "show_volume": volume_var.get(),
+    }
+
+    # Reemplazar la ejecución en curso (si la hay) por la nueva
+    stop_current_run()
+    current_run["id"] += 1
+    current_run["cancel"] = threading.Event()
+    current_run["params"] = params
+    status_var.set("Iniciando...")
+    executor.submit(run_pipeline, current_run["id"], current_run["cancel"], params)
+
+def cancel_strategy():
+    """Cancela la ejecución en curso; sus resultados se descartan."""
+    stop_current_run()
+    current_run["id"] += 1
+    status_var.set("Ejecución cancelada.")
+
+def poll_results(root):
+    """Procesa en el hilo de Tk los mensajes publicados por el hilo de trabajo."""
+    try:
+        while True:
+            run_id, kind, payload = results_queue.get_nowait()
+            if run_id != current_run["id"]:
+                continue  # Mensaje de una ejecución cancelada o reemplazada
+            if kind == "progress":
+                name, timings = payload
+                status_var.set(" | ".join(filter(None, [format_timings(timings), f"{name}..."])))
+            elif kind == "error":
+                result_var.set(payload)
+                status_var.set("")
+            elif kind == "cancelled":
+                status_var.set("Ejecución cancelada.")
+            elif kind == "done":
+                show_results(payload)
+    except queue.Empty:
+        pass
+    root.after(POLL_MS, poll_results, root)
+
+def show_results(result):
+    """Muestra los resultados y dibuja el gráfico (hilo de Tk)."""
+    params = current_run["params"]
     # Actualizar resultados (formateados)
-    result_text = (f"Estrategia: {selected_strategy}\n"
-                   f"Capital Inicial: {format_money(initial_capital)}\n"
-                   f"Rendimiento Estrategia: {format_money(profit_strategy)}\n"
-                   f"Rendimiento Buy & Hold: {format_money(profit_buy_hold)}")
+    result_text = (f"Estrategia: {params['strategy_name']} ({params['mode_label']})\n"
+                   f"Capital Inicial: {format_money(params['initial_capital'])}\n"
+                   f"Rendimiento Estrategia: {format_stats(result['stats_strategy'])}\n"
+                   f"Rendimiento Buy & Hold: {format_stats(result['stats_buy_hold'])}")
     result_var.set(result_text)
-    
+    status_var.set(format_timings(result["timings"]) + " | Gráfico...")
+    frame_right.update_idletasks()
+
     # Graficar velas japonesas con indicadores y volumen (si corresponde)
-    plot_candlestick(data, frame_right, show_volume)
+    started = time.perf_counter()
+    plot_candlestick(result["data"], frame_right, params["show_volume"], result["indicators"])
+    timings = result["timings"] + [("Gráfico", time.perf_counter() - started)]
+    status_var.set(format_timings(timings) + f" | Total: {sum(seconds for _, seconds in timings):.2f}s")
 
 def create_interface():
-    global symbol_var, interval_var, start_date_var, end_date_var, strategy_var, capital_var, percent_var, volume_var, result_var, frame_right, strategies_dict
+    global symbol_var, interval_var, start_date_var, end_date_var, strategy_var, capital_var, percent_var, mode_var, volume_var, result_var, status_var, frame_right, strategies_dict
 
     root = tk.Tk()
     root.title("Análisis de Estrategias de Trading")
@@ -255,7 +289,7 @@ def create_interface():
     tk.Label(frame_left, text="Intervalo:", fg="white", bg="#2e2e2e").pack(anchor="w")
     global interval_var
     interval_var = tk.StringVar(value="1h")
-    ttk.Combobox(frame_left, textvariable=interval_var, values=["1m","5m","15m","30m","1h","1d"], state="readonly").pack(fill=tk.X, pady=2)
+    ttk.Combobox(frame_left, textvariable=interval_var, values=["1m","5m","15m","30m","1h","4h","1d","3d","1w"], state="readonly").pack(fill=tk.X, pady=2)
 
     tk.Label(frame_left, text="Fecha de Inicio (YYYY-MM-DD):", fg="white", bg="#2e2e2e").pack(anchor="w")
     global start_date_var
@@ -269,13 +303,16 @@ def create_interface():
 
     tk.Label(frame_left, text="Estrategia:", fg="white", bg="#2e2e2e").pack(anchor="w")
     global strategy_var
-    # Cargar estrategias dinámicamente desde la carpeta "estrategias"
-    strategies_dict = load_strategies()
+    # Descubrir las estrategias de la carpeta "estrategias" (se importan al seleccionarlas)
+    strategies_dict = StrategyCatalog()
     strategy_names = list(strategies_dict.keys())
     if not strategy_names:
         strategy_names = ["Sin estrategias"]
     strategy_var = tk.StringVar(value=strategy_names[0])
-    ttk.Combobox(frame_left, textvariable=strategy_var, values=strategy_names, state="readonly").pack(fill=tk.X, pady=2)
+    strategy_combo = ttk.Combobox(frame_left, textvariable=strategy_var, values=strategy_names, state="readonly")
+    # Al desplegar la lista se detectan estrategias nuevas o renombradas
+    strategy_combo.configure(postcommand=lambda: strategy_combo.configure(values=strategies_dict.refresh() or ["Sin estrategias"]))
+    strategy_combo.pack(fill=tk.X, pady=2)
 
     tk.Label(frame_left, text="Capital Inicial (USD):", fg="white", bg="#2e2e2e").pack(anchor="w")
     global capital_var
@@ -287,19 +324,32 @@ def create_interface():
     percent_var = tk.StringVar(value="10")
     tk.Entry(frame_left, textvariable=percent_var, bg="#3e3e3e", fg="white").pack(fill=tk.X, pady=2)
 
+    tk.Label(frame_left, text="Modo de Backtest:", fg="white", bg="#2e2e2e").pack(anchor="w")
+    global mode_var
+    mode_var = tk.StringVar(value="Vela siguiente")
+    ttk.Combobox(frame_left, textvariable=mode_var, values=list(BACKTEST_MODES.keys()), state="readonly").pack(fill=tk.X, pady=2)
+
     global volume_var
     volume_var = tk.BooleanVar(value=False)
     tk.Checkbutton(frame_left, text="Mostrar Volumen", variable=volume_var, bg="#2e2e2e", fg="white", selectcolor="#2e2e2e").pack(anchor="w", pady=2)
 
-    tk.Button(frame_left, text="Ejecutar Estrategia", command=execute_strategy, bg="#4e4e4e", fg="white").pack(pady=10)
+    tk.Button(frame_left, text="Ejecutar Estrategia", command=execute_strategy, bg="#4e4e4e", fg="white").pack(pady=(10, 2))
+    tk.Button(frame_left, text="Cancelar", command=cancel_strategy, bg="#4e4e4e", fg="white").pack(pady=2)
 
     global result_var
     result_var = tk.StringVar()
     tk.Label(frame_bottom, textvariable=result_var, font=("Arial", 12), fg="white", bg="#2e2e2e", justify=tk.LEFT).pack(anchor="w")
 
+    global status_var
+    status_var = tk.StringVar()
+    tk.Label(frame_bottom, textvariable=status_var, font=("Arial", 10), fg="#aaaaaa", bg="#2e2e2e", justify=tk.LEFT).pack(anchor="w")
+
+    root.after(POLL_MS, poll_results, root)
     root.mainloop()
+    current_run["cancel"].set()
+    executor.shutdown(wait=False, cancel_futures=True)
+    if "db" in sys.modules:
+        sys.modules["db"].close_pool()
 
 if __name__ == "__main__":
-    # Cargar estrategias de la carpeta "estrategias"
-    strategies_dict = load_strategies()
     create_interface()
@@ -0,0 +1,73 @@
+import numpy as np
+
+#############################
+# INTERVALOS DE VELAS
+#############################
+
+# Duración de cada intervalo de Binance en milisegundos
+INTERVAL_MS = {
+    "1m": 60_000, "3m": 180_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000,
+    "1h": 3_600_000, "2h": 7_200_000, "4h": 14_400_000, "6h": 21_600_000,
+    "8h": 28_800_000, "12h": 43_200_000, "1d": 86_400_000, "3d": 259_200_000,
+    "1w": 604_800_000,
+}
+# Las velas semanales empiezan el lunes y la época Unix fue jueves
+INTERVAL_OFFSET_MS = {"1w": 4 * 86_400_000}
+
+def bucket_start(timestamps, interval):
+    """Timestamp (ms) de apertura de la vela de 'interval' que contiene cada timestamp."""
+    step = INTERVAL_MS[interval]
+    offset = INTERVAL_OFFSET_MS.get(interval, 0)
+    return (np.asarray(timestamps, dtype=np.int64) - offset) // step * step + offset
+
+def next_close_time(interval, now_ms):
+    """Timestamp (ms) del próximo cierre de vela del intervalo posterior a 'now_ms'."""
+    step = INTERVAL_MS[interval]
+    offset = INTERVAL_OFFSET_MS.get(interval, 0)
+    return ((now_ms - offset) // step + 1) * step + offset
+
+#############################
+# AGREGACIÓN EN MEMORIA (RESAMPLEO VECTORIZADO)
+#############################
+
+# Cómo se agrega cada columna al pasar a un intervalo mayor
+ROLLUP_AGGREGATIONS = {
+    "open": "first",
+    "high": "max",
+    "low": "min",
+    "close": "last",
+    "volume": "sum",
+    "quote_asset_volume": "sum",
+    "number_of_trades": "sum",
+    "taker_buy_base_asset_volume": "sum",
+    "taker_buy_quote_asset_volume": "sum",
+}
+
+def resample_candles(columns, interval):
+    """
+    Agrega velas ordenadas por timestamp (dict de arrays) al intervalo 'interval'.
+    Se agregan las columnas presentes de ROLLUP_AGGREGATIONS con reduceat, sin bucles
+    en Python. La vela resultante lleva el timestamp de apertura de su intervalo.
+    """
+    timestamps = np.asarray(columns["timestamp"], dtype=np.int64)
+    present = [col for col in ROLLUP_AGGREGATIONS if col in columns]
+    if len(timestamps) == 0:
+        return {"timestamp": timestamps, **{col: np.asarray(columns[col])[:0] for col in present}}
+    buckets = bucket_start(timestamps, interval)
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    ends = np.concatenate((starts[1:], [len(timestamps)])) - 1
+    result = {"timestamp": buckets[starts]}
+    for col in present:
+        values = np.asarray(columns[col])
+        how = ROLLUP_AGGREGATIONS[col]
+        if how == "first":
+            result[col] = values[starts]
+        elif how == "last":
+            result[col] = values[ends]
+        elif how == "max":
+            result[col] = np.maximum.reduceat(values, starts)
+        elif how == "min":
+            result[col] = np.minimum.reduceat(values, starts)
+        else:
+            result[col] = np.add.reduceat(values, starts)
+    return result
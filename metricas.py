@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import bisect
+import inspect
+import logging
+import threading
+import functools
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+#############################
+# MÉTRICAS EN MEMORIA (CONTADORES, GAUGES E HISTOGRAMAS)
+#############################
+#
+# Cada métrica se identifica por (nombre, etiquetas). Se exponen en formato de
+# texto de Prometheus por HTTP local y se pueden volcar periódicamente a JSON.
+
+PREFIX = "cripto_"
+
+# Límites (segundos) de los histogramas de latencia
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+_help = {}
+
+def _key(name, labels):
+    return PREFIX + name, tuple(sorted((labels or {}).items()))
+
+def inc(name, value=1, labels=None, help_text=None):
+    """Incrementa un contador."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+        if help_text:
+            _help.setdefault(key[0], help_text)
+
+def set_gauge(name, value, labels=None, help_text=None):
+    """Fija el valor actual de un gauge."""
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+        if help_text:
+            _help.setdefault(key[0], help_text)
+
+def observe(name, value, labels=None, help_text=None):
+    """Registra una observación en un histograma (p. ej. una latencia en segundos)."""
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0}
+        index = bisect.bisect_left(LATENCY_BUCKETS, value)
+        if index < len(LATENCY_BUCKETS):
+            hist["buckets"][index] += 1
+        hist["sum"] += value
+        hist["count"] += 1
+        if help_text:
+            _help.setdefault(key[0], help_text)
+
+def instrument(name, label_args=("symbol", "interval")):
+    """
+    Decorador que mide las llamadas a una función: número de llamadas, errores y
+    un histograma de latencia, etiquetados con los argumentos 'label_args'.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind_partial(*args, **kwargs)
+            labels = {arg: str(bound.arguments[arg]) for arg in label_args if arg in bound.arguments}
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                inc(f"{name}_errors_total", labels=labels, help_text=f"Errores en {name}")
+                raise
+            finally:
+                inc(f"{name}_calls_total", labels=labels, help_text=f"Llamadas a {name}")
+                observe(f"{name}_seconds", time.perf_counter() - started, labels=labels,
+                        help_text=f"Latencia de {name} en segundos")
+        return wrapper
+    return decorator
+
+#############################
+# EXPOSICIÓN: TEXTO DE PROMETHEUS Y JSON
+#############################
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+def prometheus_text():
+    """Todas las métricas en el formato de texto de exposición de Prometheus."""
+    lines = []
+    with _lock:
+        for kind, store in (("counter", _counters), ("gauge", _gauges)):
+            for name in sorted({name for name, _ in store}):
+                if name in _help:
+                    lines.append(f"# HELP {name} {_help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for (metric, labels), value in sorted(store.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+        for name in sorted({name for name, _ in _histograms}):
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), hist in sorted(_histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, hist["buckets"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {hist['count']}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {hist['sum']}")
+                lines.append(f"{name}_count{_format_labels(labels)} {hist['count']}")
+    return "\n".join(lines) + "\n"
+
+def snapshot():
+    """Copia de todas las métricas como estructura JSON serializable."""
+    def entries(store):
+        return [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in store.items()]
+    with _lock:
+        return {
+            "timestamp": time.time(),
+            "counters": entries(_counters),
+            "gauges": entries(_gauges),
+            "histograms": [{"name": name, "labels": dict(labels), "buckets": dict(zip(LATENCY_BUCKETS, h["buckets"])),
+                            "sum": h["sum"], "count": h["count"]}
+                           for (name, labels), h in _histograms.items()],
+        }
+
+def start_http_server(port, host="127.0.0.1"):
+    """Sirve /metrics en texto de Prometheus desde un hilo en segundo plano."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metricas-http").start()
+    logging.info(f"Métricas disponibles en http://{host}:{port}/metrics")
+    return server
+
+def start_json_snapshots(path, interval_seconds=60):
+    """Escribe periódicamente un volcado JSON de las métricas en 'path'."""
+    def loop():
+        while True:
+            time.sleep(interval_seconds)
+            try:
+                with open(path + ".tmp", "w") as f:
+                    json.dump(snapshot(), f)
+                os.replace(path + ".tmp", path)
+            except OSError as e:
+                logging.warning(f"No se pudo guardar el volcado de métricas: {e}")
+    threading.Thread(target=loop, daemon=True, name="metricas-json").start()
@@ -0,0 +1,198 @@
+import io
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+from backtest import run_backtest, buy_and_hold_backtest, encode_signals, max_drawdown, MODE_NEXT_CANDLE, MODE_POSITION
+from estrategia import run_strategy, strategy_params
+from optimizador import parse_grid_arg
+from db import connection, date_to_timestamp
+
+# Configuración de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+PRICE_COLUMNS = ["open", "high", "low", "close", "volume"]
+
+# Nombre de la fila con los resultados agregados de la cartera
+PORTFOLIO_ROW = "PORTFOLIO"
+
+#############################
+# MATRIZ DE PRECIOS ALINEADA (TIEMPO x SÍMBOLO)
+#############################
+#
+# Todas las velas de los símbolos pedidos se leen con una sola consulta y se
+# colocan en matrices (tiempo x símbolo) indexadas por la unión de timestamps.
+# Las velas que faltan quedan como NaN y se marcan en 'mask' (True = hay vela).
+
+def load_price_matrix(symbols, interval, start_ts, end_ts):
+    """
+    Devuelve un dict con 'timestamp' (T,), 'symbols' (lista de S), 'mask' (T, S) bool
+    y una matriz (T, S) float64 por columna OHLCV, con NaN donde falta la vela.
+    Solo admite intervalos guardados en 'candlestick_data' (no los 'adhoc').
+    """
+    with connection() as conn, conn.cursor() as cursor:
+        query = cursor.mogrify("""
+            SELECT symbol, timestamp, open, high, low, close, volume
+            FROM candlestick_data
+            WHERE symbol = ANY(%s) AND interval = %s AND timestamp >= %s AND timestamp <= %s
+        """, (list(symbols), interval, start_ts, end_ts)).decode()
+        buffer = io.StringIO()
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", buffer)
+    buffer.seek(0)
+    dtypes = {"symbol": str, "timestamp": np.int64, **{col: np.float64 for col in PRICE_COLUMNS}}
+    frame = pd.read_csv(buffer, header=None, names=list(dtypes), dtype=dtypes)
+
+    timestamps, rows = np.unique(frame["timestamp"].to_numpy(), return_inverse=True)
+    cols = pd.Categorical(frame["symbol"], categories=list(symbols)).codes
+    shape = (len(timestamps), len(symbols))
+    prices = {"timestamp": timestamps, "symbols": list(symbols)}
+    for col in PRICE_COLUMNS:
+        matrix = np.full(shape, np.nan)
+        matrix[rows, cols] = frame[col].to_numpy()
+        prices[col] = matrix
+    mask = np.zeros(shape, dtype=bool)
+    mask[rows, cols] = True
+    prices["mask"] = mask
+    return prices
+
+def fill_missing(matrix, mask):
+    """
+    Propaga hacia adelante (eje 0) el último valor presente de cada columna.
+    Las filas anteriores a la primera vela del símbolo siguen siendo NaN.
+    """
+    idx = np.where(mask, np.arange(len(matrix))[:, None], -1)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    filled = np.take_along_axis(matrix, np.maximum(idx, 0), axis=0)
+    filled[idx < 0] = np.nan
+    return filled
+
+#############################
+# SEÑALES Y BACKTEST POR LOTES
+#############################
+
+def batch_signals(strategy_mod, prices, **params):
+    """
+    Calcula las señales (T, S) int8 de la estrategia para todos los símbolos.
+    Si el módulo declara 'supports_matrix', se llama una sola vez con las matrices
+    completas; si no, se ejecuta columna a columna. Las velas ausentes no tienen señal.
+    """
+    mask = prices["mask"]
+    data = {col: fill_missing(prices[col], mask) for col in PRICE_COLUMNS}
+    if getattr(strategy_mod, "supports_matrix", False):
+        signals, _ = strategy_mod.generate_signals(data, **strategy_params(strategy_mod, **params))
+        signals = encode_signals(signals).reshape(mask.shape)
+    else:
+        signals = np.zeros(mask.shape, dtype=np.int8)
+        for j in range(mask.shape[1]):
+            frame = pd.DataFrame({col: values[:, j] for col, values in data.items()})
+            frame["timestamp"] = pd.to_datetime(prices["timestamp"], unit="ms")
+            signals[:, j], _ = run_strategy(strategy_mod, frame, **params)
+    signals[~mask] = 0
+    return signals
+
+def batch_backtest(prices, signals, initial_capital, percent_per_trade, mode=MODE_NEXT_CANDLE):
+    """
+    Backtest de cada símbolo y de la cartera equiponderada.
+    El capital inicial se reparte a partes iguales entre los símbolos y cada operación
+    invierte 'percent_per_trade' % de la parte asignada. Cada símbolo se simula desde
+    su primera vela; en los huecos se mantiene el último cierre.
+    Devuelve (tabla de resultados con una fila por símbolo más la cartera, curva de capital
+    de la cartera).
+    """
+    symbols = prices["symbols"]
+    mask = prices["mask"]
+    close = fill_missing(prices["close"], mask)
+    capital = initial_capital / max(len(symbols), 1)
+    portfolio_pnl = np.zeros(len(close))
+    trade_pnls = []
+    rows = []
+
+    for j, symbol in enumerate(symbols):
+        present = np.flatnonzero(mask[:, j])
+        row = {"symbol": symbol, "candles": len(present)}
+        if len(present) == 0:
+            logging.info(f"Sin velas para {symbol} en el periodo indicado.")
+            rows.append({**row, "profit": 0.0, "total_return": 0.0, "max_drawdown": 0.0,
+                         "trades": 0, "win_rate": 0.0, "coverage": 0.0, "buy_hold_return": 0.0})
+            continue
+        first = present[0]
+        result = run_backtest(close[first:, j], signals[first:, j], capital, percent_per_trade, mode=mode)
+        portfolio_pnl[first:] += np.diff(result["equity"], prepend=capital)
+        trade_pnls.append(result["trade_pnl"])
+        hold = buy_and_hold_backtest(close[first:, j], capital)
+        rows.append({**row, **result["stats"],
+                     "coverage": len(present) / (len(close) - first),
+                     "buy_hold_return": hold["stats"]["total_return"]})
+
+    equity = initial_capital + np.cumsum(portfolio_pnl)
+    trade_pnl = np.concatenate(trade_pnls) if trade_pnls else np.empty(0)
+    profit = float(portfolio_pnl.sum())
+    table = pd.DataFrame(rows)
+    portfolio = {
+        "symbol": PORTFOLIO_ROW,
+        "candles": int(mask.sum()),
+        "profit": profit,
+        "total_return": profit / initial_capital if initial_capital else 0.0,
+        "max_drawdown": max_drawdown(equity),
+        "trades": len(trade_pnl),
+        "win_rate": float((trade_pnl > 0).sum() / len(trade_pnl)) if len(trade_pnl) else 0.0,
+        "coverage": float(mask.mean()) if mask.size else 0.0,
+        "buy_hold_return": float(table["buy_hold_return"].mean()) if len(table) else 0.0,
+    }
+    table = pd.concat([table, pd.DataFrame([portfolio])], ignore_index=True)
+    return table, equity
+
+def run_batch(strategy_mod, symbols, interval, start_date, end_date, initial_capital, percent_per_trade,
+              mode=MODE_NEXT_CANDLE, **params):
+    """Carga la matriz de precios, genera las señales y devuelve (tabla de resultados, curva de la cartera)."""
+    prices = load_price_matrix(symbols, interval, date_to_timestamp(start_date), date_to_timestamp(end_date))
+    logging.info(f"Matriz de precios: {len(prices['timestamp'])} velas x {len(symbols)} símbolos "
+                 f"({prices['mask'].mean() if prices['mask'].size else 0:.1%} presentes).")
+    signals = batch_signals(strategy_mod, prices, **params)
+    return batch_backtest(prices, signals, initial_capital, percent_per_trade, mode=mode)
+
+#############################
+# LÍNEA DE COMANDOS
+#############################
+
+def build_arg_parser():
+    def parse_param_arg(text):
+        name, values = parse_grid_arg(text)
+        if len(values) != 1:
+            raise argparse.ArgumentTypeError(f"Se esperaba un único valor: {text}")
+        return name, values[0]
+
+    parser = argparse.ArgumentParser(description="Backtest de una estrategia sobre varios símbolos a la vez.")
+    parser.add_argument("--strategy", default="EMA", help="Nombre de la estrategia (strategy_name).")
+    parser.add_argument("--symbols", nargs="+", required=True)
+    parser.add_argument("--interval", default="1h")
+    parser.add_argument("--start", default="2017-01-01", help="Fecha de inicio (YYYY-MM-DD).")
+    parser.add_argument("--end", default="2017-02-03", help="Fecha de fin (YYYY-MM-DD).")
+    parser.add_argument("--params", nargs="*", type=parse_param_arg, default=[],
+                        help="Parámetros de la estrategia, p. ej. fast=10 slow=50.")
+    parser.add_argument("--capital", type=float, default=1000)
+    parser.add_argument("--percent", type=float, default=10)
+    parser.add_argument("--mode", choices=[MODE_NEXT_CANDLE, MODE_POSITION], default=MODE_NEXT_CANDLE)
+    parser.add_argument("--rank-by", default="total_return")
+    parser.add_argument("--output", help="Ruta donde guardar la tabla (.csv o .json).")
+    return parser
+
+if __name__ == "__main__":
+    from cargador import load_strategies
+
+    args = build_arg_parser().parse_args()
+    strategies = load_strategies()
+    if args.strategy not in strategies:
+        raise SystemExit(f"Estrategia no encontrada: {args.strategy}")
+
+    results, _ = run_batch(strategies[args.strategy], args.symbols, args.interval, args.start, args.end,
+                           args.capital, args.percent, mode=args.mode, **dict(args.params))
+    symbols = results[results["symbol"] != PORTFOLIO_ROW].sort_values(args.rank_by, ascending=False)
+    results = pd.concat([symbols, results[results["symbol"] == PORTFOLIO_ROW]], ignore_index=True)
+    print(results.to_string(index=False))
+    if args.output:
+        if args.output.endswith(".json"):
+            results.to_json(args.output, orient="records", indent=2)
+        else:
+            results.to_csv(args.output, index=False)
+        logging.info(f"Resultados guardados en {args.output}")
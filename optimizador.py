@@ -0,0 +1,158 @@
+import os
+import argparse
+import itertools
+import tempfile
+import importlib.util
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from backtest import run_backtest, MODE_NEXT_CANDLE, MODE_POSITION
+from estrategia import run_strategy
+
+# Configuración de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Columnas OHLCV que se comparten con los procesos trabajadores (vía archivo mapeado en memoria)
+SHARED_COLUMNS = ["open", "high", "low", "close", "volume"]
+
+#############################
+# REJILLA DE PARÁMETROS
+#############################
+
+def parameter_grid(grid, strategy_mod=None):
+    """
+    Genera todas las combinaciones de una rejilla {parametro: [valores]} como lista de dicts.
+    Si la estrategia define 'valid_params(**params)', se descartan las combinaciones inválidas.
+    """
+    names = list(grid.keys())
+    combos = [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+    validator = getattr(strategy_mod, "valid_params", None)
+    if validator is not None:
+        combos = [params for params in combos if validator(**params)]
+    return combos
+
+def parse_grid_arg(text):
+    """
+    Interpreta un argumento 'nombre=valores' de la línea de comandos.
+    Los valores pueden ser una lista '5,10,20' o un rango inclusivo 'inicio:fin:paso'.
+    """
+    name, _, values = text.partition("=")
+    if not name or not values:
+        raise argparse.ArgumentTypeError(f"Formato de rejilla inválido: {text}")
+    if ":" in values:
+        start, stop, step = (int(v) for v in values.split(":"))
+        return name, list(range(start, stop + 1, step))
+    return name, [int(v) if v.lstrip("-").isdigit() else float(v) for v in values.split(",")]
+
+#############################
+# PROCESOS TRABAJADORES
+#############################
+
+# Estado de cada proceso trabajador (se inicializa una vez por proceso)
+_worker_state = {}
+
+def _load_strategy_module(path):
+    """Carga un módulo de estrategia a partir de la ruta de su archivo."""
+    module_name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+def _init_worker(matrix_path, strategy_path, initial_capital, percent_per_trade, mode):
+    """Mapea en memoria la matriz OHLCV compartida y carga la estrategia en el proceso."""
+    matrix = np.load(matrix_path, mmap_mode="r")
+    _worker_state.update(
+        data={col: matrix[i] for i, col in enumerate(SHARED_COLUMNS)},
+        strategy=_load_strategy_module(strategy_path),
+        initial_capital=initial_capital,
+        percent_per_trade=percent_per_trade,
+        mode=mode,
+    )
+
+def _evaluate(params):
+    """Evalúa una combinación de parámetros y devuelve sus estadísticas."""
+    data = _worker_state["data"]
+    signals, _ = run_strategy(_worker_state["strategy"], data, **params)
+    result = run_backtest(data["close"], signals, _worker_state["initial_capital"],
+                          _worker_state["percent_per_trade"], mode=_worker_state["mode"])
+    return {**params, **result["stats"]}
+
+#############################
+# BARRIDO DE PARÁMETROS
+#############################
+
+def sweep(strategy_mod, data, grid, initial_capital, percent_per_trade,
+          mode=MODE_NEXT_CANDLE, workers=None, rank_by="total_return"):
+    """
+    Evalúa todas las combinaciones de 'grid' para la estrategia en un pool de procesos.
+    Los arrays OHLCV de 'data' se escriben una sola vez en un archivo .npy que los
+    trabajadores mapean en memoria (el sistema operativo comparte las páginas),
+    así que no se serializan en cada tarea.
+    Devuelve un DataFrame con una fila por combinación, ordenado por 'rank_by'.
+    """
+    combos = parameter_grid(grid, strategy_mod)
+    if not combos:
+        return pd.DataFrame()
+    matrix_shape = (len(SHARED_COLUMNS), len(data["close"]))
+    fd, matrix_path = tempfile.mkstemp(suffix=".npy", prefix="ohlcv_")
+    os.close(fd)
+    try:
+        matrix = np.lib.format.open_memmap(matrix_path, mode="w+", dtype=np.float64, shape=matrix_shape)
+        for i, col in enumerate(SHARED_COLUMNS):
+            matrix[i] = np.asarray(data[col], dtype=np.float64)
+        matrix.flush()
+        del matrix
+        workers = workers or os.cpu_count() or 1
+        chunksize = max(1, len(combos) // (workers * 4))
+        logging.info(f"Evaluando {len(combos)} combinaciones de {strategy_mod.strategy_name} con {workers} procesos.")
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(matrix_path, strategy_mod.__file__,
+                                           initial_capital, percent_per_trade, mode)) as pool:
+            rows = list(pool.map(_evaluate, combos, chunksize=chunksize))
+    finally:
+        os.remove(matrix_path)
+    results = pd.DataFrame(rows)
+    return results.sort_values(rank_by, ascending=False, ignore_index=True)
+
+#############################
+# LÍNEA DE COMANDOS
+#############################
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Barrido de parámetros de una estrategia en paralelo.")
+    parser.add_argument("--strategy", default="EMA", help="Nombre de la estrategia (strategy_name).")
+    parser.add_argument("--symbol", default="BTCUSDT")
+    parser.add_argument("--interval", default="1h")
+    parser.add_argument("--start", default="2017-01-01", help="Fecha de inicio (YYYY-MM-DD).")
+    parser.add_argument("--end", default="2017-02-03", help="Fecha de fin (YYYY-MM-DD).")
+    parser.add_argument("--grid", nargs="+", type=parse_grid_arg, required=True,
+                        help="Rejilla de parámetros, p. ej. fast=5:30:5 slow=20,50,100.")
+    parser.add_argument("--capital", type=float, default=1000)
+    parser.add_argument("--percent", type=float, default=10)
+    parser.add_argument("--mode", choices=[MODE_NEXT_CANDLE, MODE_POSITION], default=MODE_NEXT_CANDLE)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--rank-by", default="total_return")
+    parser.add_argument("--top", type=int, default=20, help="Filas a mostrar.")
+    parser.add_argument("--output", help="Ruta CSV donde guardar la tabla completa.")
+    return parser
+
+if __name__ == "__main__":
+    from db import fetch_data_from_db
+    from cargador import load_strategies
+
+    args = build_arg_parser().parse_args()
+    strategies = load_strategies()
+    if args.strategy not in strategies:
+        raise SystemExit(f"Estrategia no encontrada: {args.strategy}")
+    data = fetch_data_from_db(args.symbol, args.interval, args.start, args.end)
+    if data is None or data.empty:
+        raise SystemExit("No se obtuvieron datos para el periodo especificado.")
+
+    results = sweep(strategies[args.strategy], data, dict(args.grid), args.capital, args.percent,
+                    mode=args.mode, workers=args.workers, rank_by=args.rank_by)
+    print(results.head(args.top).to_string())
+    if args.output:
+        results.to_csv(args.output, index=False)
+        logging.info(f"Resultados guardados en {args.output}")
@@ -0,0 +1,55 @@
+import numpy as np
+
+#############################
+# BUFFER CIRCULAR DE VELAS
+#############################
+
+# Columnas guardadas por vela (mismo orden que las klines de Binance, sin 'ignore')
+KLINE_COLUMNS = (
+    "timestamp", "open", "high", "low", "close", "volume", "close_time",
+    "quote_asset_volume", "number_of_trades", "taker_buy_base_asset_volume",
+    "taker_buy_quote_asset_volume",
+)
+
+class CandleRingBuffer:
+    """
+    Guarda las últimas 'capacity' velas de un (símbolo, intervalo) en arrays NumPy de
+    tamaño fijo. La vela en curso se actualiza en su sitio; una vela con timestamp
+    nuevo sobrescribe la más antigua cuando el buffer está lleno.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.values = np.zeros((capacity, len(KLINE_COLUMNS)), dtype=np.float64)
+        self.closed = np.zeros(capacity, dtype=bool)
+        self.next = 0     # Posición donde se escribirá la próxima vela nueva
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def last_timestamp(self):
+        if self.count == 0:
+            return None
+        return int(self.values[(self.next - 1) % self.capacity, 0])
+
+    def upsert(self, row, closed):
+        """Añade la vela 'row' (valores en el orden de KLINE_COLUMNS) o actualiza la última."""
+        if self.count and int(row[0]) == self.last_timestamp():
+            pos = (self.next - 1) % self.capacity
+        else:
+            pos = self.next
+            self.next = (self.next + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+        self.values[pos] = row
+        self.closed[pos] = closed
+
+    def latest(self, n=None):
+        """Devuelve un dict de arrays con las últimas 'n' velas en orden cronológico."""
+        n = self.count if n is None else min(n, self.count)
+        order = (np.arange(self.next - n, self.next)) % self.capacity
+        rows = self.values[order]
+        result = {col: rows[:, i] for i, col in enumerate(KLINE_COLUMNS)}
+        result["timestamp"] = result["timestamp"].astype(np.int64)
+        result["closed"] = self.closed[order]
+        return result
@@ -0,0 +1,116 @@
+import logging
+from db import connection
+from config import rollup_settings
+from intervalos import INTERVAL_MS, INTERVAL_OFFSET_MS, bucket_start
+
+#############################
+# AGREGADOS MATERIALIZADOS A PARTIR DE VELAS DE 1m
+#############################
+
+# Intervalo que se descarga de Binance y a partir del cual se construyen los demás
+BASE_INTERVAL = "1m"
+
+_settings = rollup_settings()
+# Intervalos que se guardan en candlestick_data tras cada descarga de 1m
+ROLLUP_INTERVALS = _settings["materialized"]
+# Intervalos que no se guardan y se agregan en memoria al consultarlos
+ADHOC_INTERVALS = _settings["adhoc"]
+
+# Agrega las velas de 1m de [since, until) y actualiza las velas del intervalo
+# destino. La última vela puede estar incompleta, por eso se usa DO UPDATE.
+_ROLLUP_SQL = """
+    INSERT INTO candlestick_data (
+        timestamp, symbol, interval, open, high, low, close, volume,
+        quote_asset_volume, number_of_trades, taker_buy_base_asset_volume,
+        taker_buy_quote_asset_volume)
+    SELECT bucket, symbol, %(target)s,
+           (array_agg(open ORDER BY timestamp))[1],
+           MAX(high),
+           MIN(low),
+           (array_agg(close ORDER BY timestamp DESC))[1],
+           SUM(volume),
+           SUM(quote_asset_volume),
+           SUM(number_of_trades),
+           SUM(taker_buy_base_asset_volume),
+           SUM(taker_buy_quote_asset_volume)
+    FROM (
+        SELECT *, (timestamp - %(offset)s) / %(step)s * %(step)s + %(offset)s AS bucket
+        FROM candlestick_data
+        WHERE symbol = %(symbol)s AND interval = %(base)s
+          AND timestamp >= %(since)s AND timestamp < %(until)s
+    ) AS base
+    GROUP BY bucket, symbol
+    ON CONFLICT (timestamp, symbol, interval) DO UPDATE SET
+        open = EXCLUDED.open,
+        high = EXCLUDED.high,
+        low = EXCLUDED.low,
+        close = EXCLUDED.close,
+        volume = EXCLUDED.volume,
+        quote_asset_volume = EXCLUDED.quote_asset_volume,
+        number_of_trades = EXCLUDED.number_of_trades,
+        taker_buy_base_asset_volume = EXCLUDED.taker_buy_base_asset_volume,
+        taker_buy_quote_asset_volume = EXCLUDED.taker_buy_quote_asset_volume;
+"""
+
+# Límite superior de _ROLLUP_SQL cuando se agrega hasta la última vela
+NO_LIMIT = 2**63 - 1
+
+def update_rollups(symbol, intervals=ROLLUP_INTERVALS):
+    """
+    Actualiza de forma incremental los intervalos agregados de 'symbol'.
+    Para cada intervalo se recalcula solo desde la última vela agregada (incluida,
+    porque podía estar incompleta). Devuelve {intervalo: filas escritas}.
+    """
+    written = {}
+    with connection() as conn, conn.cursor() as cursor:
+        for target in intervals:
+            if target not in INTERVAL_MS or target == BASE_INTERVAL:
+                logging.warning(f"Intervalo de agregado no válido: {target}. Se omite.")
+                continue
+            cursor.execute("""
+                SELECT MAX(timestamp) FROM candlestick_data
+                WHERE symbol = %s AND interval = %s;
+            """, (symbol, target))
+            last = cursor.fetchone()[0]
+            cursor.execute(_ROLLUP_SQL, {
+                "target": target,
+                "base": BASE_INTERVAL,
+                "symbol": symbol,
+                "since": last or 0,
+                "until": NO_LIMIT,
+                "step": INTERVAL_MS[target],
+                "offset": INTERVAL_OFFSET_MS.get(target, 0),
+            })
+            conn.commit()
+            written[target] = cursor.rowcount
+            logging.info(f"Agregado {symbol} {BASE_INTERVAL} -> {target}: {cursor.rowcount} velas actualizadas.")
+    return written
+
+def rebuild_rollups(symbol, ranges, intervals=ROLLUP_INTERVALS):
+    """
+    Recalcula las velas agregadas que cubren los tramos [inicio, fin] de velas de 1m
+    indicados (p. ej. huecos rellenados), desde la apertura hasta el cierre de cada
+    vela agregada afectada. Devuelve {intervalo: filas escritas}.
+    """
+    written = {}
+    with connection() as conn, conn.cursor() as cursor:
+        for target in intervals:
+            if target not in INTERVAL_MS or target == BASE_INTERVAL:
+                logging.warning(f"Intervalo de agregado no válido: {target}. Se omite.")
+                continue
+            written[target] = 0
+            for start, end in ranges:
+                cursor.execute(_ROLLUP_SQL, {
+                    "target": target,
+                    "base": BASE_INTERVAL,
+                    "symbol": symbol,
+                    "since": int(bucket_start(start, target)),
+                    "until": int(bucket_start(end, target)) + INTERVAL_MS[target],
+                    "step": INTERVAL_MS[target],
+                    "offset": INTERVAL_OFFSET_MS.get(target, 0),
+                })
+                written[target] += cursor.rowcount
+            conn.commit()
+            logging.info(f"Agregado {symbol} {BASE_INTERVAL} -> {target}: {written[target]} velas recalculadas "
+                         f"en {len(ranges)} tramos.")
+    return written